@@ -0,0 +1,119 @@
+"""Throughput of create_business_cards against one create_business_card per card.
+
+Runs both mutations through an in-process copy of main.app against
+benchmarks.fake_supabase for each batch size. Every card has a distinct name,
+so each one is rendered and uploaded; --latency adds a delay to every fake
+Supabase response to stand in for the network.
+
+Run from the repository root:
+
+    python -m benchmarks.batch_create [--sizes 10 100 1000] [--latency 0.02]
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+import httpx
+from PIL import Image
+from benchmarks.fake_supabase import LatencyMiddleware, create_app, serve_in_thread
+
+SINGLE = """
+mutation ($n: String!) {
+  create_business_card(email: "bench@example.com", job_title: "Engineer",
+    full_name: $n, phone_number: "555-0100", website: "https://example.com",
+    base_card: "Business-Card-1.png") { id }
+}
+"""
+BATCH = """
+mutation ($inputs: [BusinessCardInput!]!) {
+  create_business_cards(inputs: $inputs) {
+    __typename
+    ... on BusinessCard { id }
+  }
+}
+"""
+
+
+def card_input(name):
+    return {
+        "email": "bench@example.com",
+        "job_title": "Engineer",
+        "full_name": name,
+        "phone_number": "555-0100",
+        "website": "https://example.com",
+        "base_card": "Business-Card-1.png",
+    }
+
+
+async def post(client, query, variables):
+    response = await client.post(
+        "/graphql",
+        json={"query": query, "variables": variables},
+        headers={"Authorization": "Bearer user-bench"},
+        timeout=None,
+    )
+    body = response.json()
+    assert "errors" not in body, response.text
+    return body["data"]
+
+
+async def run(app, sizes, max_single):
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            for run_id, size in enumerate(sizes):
+                names = [f"card-{run_id}-{i}" for i in range(size)]
+                start = time.perf_counter()
+                data = await post(
+                    client, BATCH, {"inputs": [card_input(n) for n in names]}
+                )
+                batch = time.perf_counter() - start
+                created = sum(
+                    result["__typename"] == "BusinessCard"
+                    for result in data["create_business_cards"]
+                )
+                assert created == size, created
+                line = f"{size:>5} cards  batch {size / batch:8.1f} cards/s"
+
+                if size <= max_single:
+                    start = time.perf_counter()
+                    for name in names:
+                        await post(client, SINGLE, {"n": f"{name}-single"})
+                    single = time.perf_counter() - start
+                    line += f"  single {size / single:8.1f} cards/s"
+                print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54333)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--max-single",
+        type=int,
+        default=100,
+        help="largest size also timed as one mutation per card",
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake_app = create_app()
+    fake = fake_app.state.fake
+    template = io.BytesIO()
+    Image.new("RGB", (1050, 600), "white").save(template, "PNG")
+    fake.put_object("default_cards", "Business-Card-1.png", template.getvalue())
+    if args.latency:
+        fake_app.add_middleware(LatencyMiddleware, delay=args.latency)
+    server = serve_in_thread(fake_app, args.port)
+
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["SUPABASE_KEY"] = "fake.supabase.key"
+    os.environ.setdefault("ORIGINS", "*")
+    import main as api
+
+    asyncio.run(run(api.app, args.sizes, args.max_single))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Cold start cost of the API: imports, startup and the first requests.
+
+Starts a fresh interpreter per run, the way a serverless platform does for a
+cold request, and uses -X importtime to measure how long importing main takes
+and which of its imports that time goes to. The same process then runs the
+startup hooks, sends a CORS preflight and a public query (against
+benchmarks.fake_supabase), and reports the time from the start to each
+response and which heavy packages had been imported by then.
+
+Exits with status 1 when the median time to the preflight response is over
+--budget milliseconds, or when a preflight made the process import Pillow,
+qrcode or numpy, so it can guard cold starts in CI. The app runs with its
+own defaults, as deployed, and --warm sets WARM_ON_STARTUP=true instead.
+
+Run from the repository root:
+
+    python -m benchmarks.cold_start [--runs 5] [--budget 750] [--warm]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from benchmarks.fake_supabase import create_app, serve_in_thread
+
+# imported only on the render path, a preflight must never load them
+RENDER_PACKAGES = ("PIL", "qrcode", "numpy")
+WATCHED_PACKAGES = (*RENDER_PACKAGES, "jose", "postgrest", "storage3", "gotrue")
+PUBLIC_QUERY = """
+query ($slug: String!) {
+  digitalCards(slug: $slug) { __typename ... on NotFoundError { message } }
+}
+"""
+
+CHILD = """
+import asyncio, json, sys, time
+
+start = time.perf_counter()
+import main
+
+timings = {"import main": time.perf_counter() - start}
+# the test client is not part of the app, leave its import out of the timings
+before_httpx = time.perf_counter()
+import httpx
+
+start += time.perf_counter() - before_httpx
+loaded = {}
+
+
+def checkpoint(name):
+    timings[name] = time.perf_counter() - start
+    loaded[name] = sorted(
+        package for package in %(watched)r if package in sys.modules
+    )
+
+
+async def first_requests():
+    async with main.app.router.lifespan_context(main.app):
+        checkpoint("startup")
+        async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+            response = await client.options(
+                "/graphql",
+                headers={
+                    "Origin": "http://localhost:3000",
+                    "Access-Control-Request-Method": "POST",
+                },
+            )
+            assert response.status_code == 200, response.text
+            checkpoint("preflight")
+            response = await client.post(
+                "/publicgraphql",
+                json={"query": %(query)r, "variables": {"slug": "missing"}},
+            )
+            assert "errors" not in response.json(), response.text
+            checkpoint("public query")
+
+
+asyncio.run(first_requests())
+print(json.dumps({"timings": timings, "loaded": loaded}))
+"""
+
+
+def import_tree(stderr, root="main"):
+    # direct imports of root with their cumulative import time in ms
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            cumulative = int(cumulative) / 1000
+        except ValueError:
+            continue  # the header line
+        level = (len(name) - len(name.lstrip())) // 2
+        entries.append((level, cumulative, name.strip()))
+
+    for index, (level, _, name) in enumerate(entries):
+        if name == root:
+            break
+    else:
+        return {}
+    children = {}
+    for child_level, cumulative, name in reversed(entries[:index]):
+        if child_level <= level:
+            break
+        if child_level == level + 1:
+            children[name] = cumulative
+    return children
+
+
+def cold_start(env):
+    code = CHILD % {"watched": WATCHED_PACKAGES, "query": PUBLIC_QUERY}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["imports"] = import_tree(result.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54335)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=750,
+        help="milliseconds from interpreter start to the preflight response",
+    )
+    parser.add_argument("--warm", action="store_true", help="WARM_ON_STARTUP=true")
+    args = parser.parse_args()
+
+    server = serve_in_thread(create_app(), args.port)
+    env = {
+        **os.environ,
+        "SUPABASE_URL": f"http://127.0.0.1:{args.port}",
+        "SUPABASE_KEY": "fake.supabase.key",
+        "ORIGINS": os.environ.get("ORIGINS", "*"),
+    }
+    if args.warm:
+        env["WARM_ON_STARTUP"] = "true"
+    else:
+        env.pop("WARM_ON_STARTUP", None)
+    reports = [cold_start(env) for _ in range(args.runs)]
+    server.should_exit = True
+
+    print(f"{'direct import of main':<40} {'ms (median)':>12}")
+    modules = {name for report in reports for name in report["imports"]}
+    medians = {
+        name: statistics.median(report["imports"].get(name, 0) for report in reports)
+        for name in modules
+    }
+    for name, ms in sorted(medians.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{name:<40} {ms:>12.1f}")
+
+    print(f"\n{'checkpoint':<16} {'ms (median)':>12}  imported by then")
+    last = reports[-1]
+    for checkpoint in last["timings"]:
+        ms = statistics.median(report["timings"][checkpoint] for report in reports)
+        loaded = ", ".join(last["loaded"].get(checkpoint, [])) or "-"
+        if checkpoint == "import main":
+            loaded = ""
+        print(f"{checkpoint:<16} {ms * 1000:>12.1f}  {loaded}")
+
+    failures = []
+    preflight = statistics.median(r["timings"]["preflight"] for r in reports) * 1000
+    if preflight > args.budget:
+        failures.append(f"preflight after {preflight:.0f} ms, budget {args.budget:g}")
+    if not args.warm:
+        rendering = {
+            package
+            for report in reports
+            for package in report["loaded"]["preflight"]
+            if package in RENDER_PACKAGES
+        }
+        if rendering:
+            failures.append(f"preflight imported {', '.join(sorted(rendering))}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"\nOK: preflight after {preflight:.0f} ms, budget {args.budget:g}")
+
+
+if __name__ == "__main__":
+    main()
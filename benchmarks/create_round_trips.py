@@ -0,0 +1,89 @@
+"""PostgREST and storage calls made per create mutation.
+
+Runs create_business_card and create_digital_card through an in-process copy
+of main.app against benchmarks.fake_supabase and prints the average number of
+requests of each kind per create, along with the mean mutation latency.
+
+Run from the repository root:
+
+    python -m benchmarks.create_round_trips [--creates 200]
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+import httpx
+from PIL import Image
+from benchmarks.fake_supabase import create_app, serve_in_thread
+
+BUSINESS_CARD = """
+mutation ($n: String!) {
+  create_business_card(email: "bench@example.com", job_title: "Engineer",
+    full_name: $n, phone_number: "555-0100", website: "https://example.com",
+    base_card: "BusinessCard.png") { id image_url }
+}
+"""
+DIGITAL_CARD = """
+mutation ($n: String!) {
+  create_digital_card(email: "bench@example.com", job_title: "Engineer",
+    full_name: $n, phone_number: "555-0100", website: "https://example.com",
+    profile_pic: "", slug: $n) { id qr_code }
+}
+"""
+
+
+async def run_creates(app, fake, query, creates):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        fake.request_counts.clear()
+        start = time.perf_counter()
+        for i in range(creates):
+            response = await client.post(
+                "/graphql",
+                json={"query": query, "variables": {"n": f"bench-{i}"}},
+                headers={"Authorization": "Bearer user-bench"},
+            )
+            assert "errors" not in response.json(), response.text
+        elapsed = time.perf_counter() - start
+    return dict(fake.request_counts), elapsed
+
+
+async def run(app, fake, creates):
+    async with app.router.lifespan_context(app):
+        for name, query in (
+            ("business", BUSINESS_CARD),
+            ("digital", DIGITAL_CARD),
+        ):
+            counts, elapsed = await run_creates(app, fake, query, creates)
+            per_create = ", ".join(
+                f"{kind} {count / creates:.1f}"
+                for kind, count in sorted(counts.items())
+                if not kind.startswith("auth.")
+            )
+            print(f"{name:<9} {elapsed / creates * 1000:6.2f}ms/create  {per_create}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54331)
+    parser.add_argument("--creates", type=int, default=200)
+    args = parser.parse_args()
+
+    fake_app = create_app()
+    fake = fake_app.state.fake
+    template = io.BytesIO()
+    Image.new("RGB", (600, 350), "white").save(template, "PNG")
+    fake.put_object("default_cards", "BusinessCard.png", template.getvalue())
+    server = serve_in_thread(fake_app, args.port)
+
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["SUPABASE_KEY"] = "fake.supabase.key"
+    os.environ.setdefault("ORIGINS", "*")
+    import main as api
+
+    asyncio.run(run(api.app, fake, args.creates))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+"""In-memory stand-in for the parts of Supabase this API talks to.
+
+Serves enough of PostgREST (/rest/v1), Storage (/storage/v1) and GoTrue
+(/auth/v1/user) for the supabase-py clients to run against it, so request
+throughput can be measured without the real service.
+
+    python -m benchmarks.fake_supabase --port 54321 [--latency 0.02,storage=0.05]
+
+Any bearer token of the form ``user-<id>`` is accepted as user ``<id>``, and JWTs
+are accepted as the user in their ``sub`` claim without verifying them. Tables
+listed in ``rls`` only show and accept rows owned by the bearer token's user,
+like the row level security policies on the real project.
+
+LatencyMiddleware delays every response to stand in for the network, either
+by the same amount or per service (rest, storage, auth), with optional jitter.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# columns that must be unique per table, like the constraints in the real schema
+UNIQUE = {
+    "digital_cards": [("slug",)],
+    "business_cards": [
+        (
+            "user_id",
+            "email",
+            "job_title",
+            "full_name",
+            "phone_number",
+            "website",
+            "base_card",
+        )
+    ],
+}
+# owner column per table for FakeSupabase(rls=RLS)
+RLS = {"business_cards": "user_id", "digital_cards": "user_id"}
+
+
+class FakeSupabase:
+    def __init__(self, unique=None, rls=None):
+        self.unique = UNIQUE if unique is None else unique
+        self.rls = rls or {}
+        self.tables = {}
+        self.buckets = {}
+        self.ids = {}
+        self.request_counts = {}
+
+    def reset(self):
+        self.tables.clear()
+        self.buckets.clear()
+        self.ids.clear()
+        self.request_counts.clear()
+
+    def count(self, kind):
+        self.request_counts[kind] = self.request_counts.get(kind, 0) + 1
+
+    def next_id(self, table):
+        if table not in self.ids:
+            self.ids[table] = itertools.count(1)
+        return next(self.ids[table])
+
+    def seed(self, table, rows):
+        for row in rows:
+            row = dict(row)
+            row.setdefault("id", self.next_id(table))
+            self.tables.setdefault(table, []).append(row)
+
+    def put_object(self, bucket, path, content, content_type="image/png"):
+        self.buckets.setdefault(bucket, {})[path] = {
+            "content": content,
+            "content_type": content_type,
+            "etag": hashlib.md5(content).hexdigest(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+
+def _parse_filter(value):
+    op, _, operand = value.partition(".")
+    negate = op == "not"
+    if negate:
+        op, _, operand = operand.partition(".")
+    if op == "in":
+        items = [item.strip('"') for item in operand.strip("()").split(",") if item]
+        return negate, op, items
+    return negate, op, operand
+
+
+def _compare(cell, op, operand):
+    if op == "is":
+        return (cell is None) if operand == "null" else str(cell).lower() == operand
+    if cell is None:
+        return False
+    if op == "in":
+        return str(cell) in operand
+    if op == "eq":
+        return str(cell) == operand
+    if op == "neq":
+        return str(cell) != operand
+    if isinstance(cell, (int, float)):
+        operand = type(cell)(operand)
+    return {
+        "gt": cell > operand,
+        "gte": cell >= operand,
+        "lt": cell < operand,
+        "lte": cell <= operand,
+    }[op]
+
+
+def _matches(row, filters):
+    for column, (negate, op, operand) in filters:
+        if _compare(row.get(column), op, operand) == negate:
+            return False
+    return True
+
+
+def _project(row, select):
+    if not select or select == "*":
+        return dict(row)
+    return {column: row.get(column) for column in select.split(",")}
+
+
+def _prefer(request):
+    prefer = {}
+    for item in request.headers.get("prefer", "").split(","):
+        key, _, value = item.strip().partition("=")
+        if key:
+            prefer[key] = value
+    return prefer
+
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def create_app(fake=None):
+    fake = fake or FakeSupabase()
+    lock = threading.Lock()
+
+    def request_user(request):
+        token = request.headers.get("authorization", "").replace("Bearer ", "")
+        return _user_id(token)
+
+    def owner_filter(request, table):
+        column = fake.rls.get(table)
+        user_id = request_user(request)
+        if column is None or user_id is None:
+            return []
+        return [(column, (False, "eq", user_id))]
+
+    def query_rows(request, table):
+        filters = [
+            (column, _parse_filter(value))
+            for column, value in request.query_params.multi_items()
+            if column not in RESERVED_PARAMS
+        ] + owner_filter(request, table)
+        rows = [row for row in fake.tables.get(table, []) if _matches(row, filters)]
+        order = request.query_params.get("order")
+        if order:
+            for part in reversed(order.split(",")):
+                column, _, direction = part.partition(".")
+                rows.sort(
+                    key=lambda row: (row.get(column) is None, row.get(column)),
+                    reverse=direction.startswith("desc"),
+                )
+        return rows
+
+    def respond(request, rows, total=None, status_code=200):
+        prefer = _prefer(request)
+        headers = {}
+        if "count" in prefer:
+            headers["content-range"] = f"0-{max(len(rows) - 1, 0)}/{total}"
+        if prefer.get("return") == "minimal":
+            return Response(status_code=204 if status_code == 200 else status_code)
+        select = request.query_params.get("select")
+        body = [_project(row, select) for row in rows]
+        return JSONResponse(body, status_code=status_code, headers=headers)
+
+    def unique_conflict(table, row, columns=None):
+        constraints = [tuple(columns)] if columns else fake.unique.get(table, [])
+        for existing in fake.tables.get(table, []):
+            for constraint in constraints:
+                if all(existing.get(c) == row.get(c) for c in constraint):
+                    return existing
+        return None
+
+    async def rest(request: Request):
+        table = request.path_params["table"]
+        fake.count(f"rest.{request.method.lower()}")
+        # read the body first, awaiting while holding the lock blocks the loop
+        body = await request.json() if request.method in ("POST", "PATCH") else None
+        with lock:
+            if request.method in ("GET", "HEAD"):
+                rows = query_rows(request, table)
+                total = len(rows)
+                offset = int(request.query_params.get("offset", 0))
+                limit = request.query_params.get("limit")
+                rows = rows[offset:]
+                if limit is not None:
+                    rows = rows[: int(limit)]
+                return respond(request, rows, total)
+
+            if request.method == "POST":
+                payload = body if isinstance(body, list) else [body]
+                prefer = _prefer(request)
+                resolution = prefer.get("resolution")
+                on_conflict = request.query_params.get("on_conflict")
+                columns = on_conflict.split(",") if on_conflict else None
+                owner = owner_filter(request, table)
+                for row in payload:
+                    if owner and not _matches(row, owner):
+                        return JSONResponse(
+                            {
+                                "code": "42501",
+                                "message": "new row violates row-level security policy",
+                                "details": None,
+                                "hint": None,
+                            },
+                            status_code=403,
+                        )
+                inserted = []
+                for row in payload:
+                    existing = unique_conflict(table, row, columns)
+                    if existing is not None:
+                        if resolution == "ignore-duplicates":
+                            continue
+                        if resolution == "merge-duplicates":
+                            existing.update(row)
+                            inserted.append(existing)
+                            continue
+                        return JSONResponse(
+                            {
+                                "code": "23505",
+                                "message": "duplicate key value violates unique constraint",
+                                "details": None,
+                                "hint": None,
+                            },
+                            status_code=409,
+                        )
+                    row = dict(row)
+                    row.setdefault("id", fake.next_id(table))
+                    fake.tables.setdefault(table, []).append(row)
+                    inserted.append(row)
+                return respond(request, inserted, len(inserted), status_code=201)
+
+            if request.method == "PATCH":
+                rows = query_rows(request, table)
+                for row in rows:
+                    row.update(body)
+                return respond(request, rows, len(rows))
+
+            if request.method == "DELETE":
+                rows = query_rows(request, table)
+                fake.tables[table] = [
+                    row for row in fake.tables.get(table, []) if row not in rows
+                ]
+                return respond(request, rows, len(rows))
+
+        return Response(status_code=405)
+
+    async def rpc(request: Request):
+        return JSONResponse({"message": "rpc is not supported"}, status_code=404)
+
+    def storage_error(status_code, error, message):
+        return JSONResponse(
+            {"statusCode": str(status_code), "error": error, "message": message},
+            status_code=status_code,
+        )
+
+    async def upload(request: Request):
+        bucket = request.path_params["bucket"]
+        path = request.path_params["path"]
+        fake.count("storage.upload")
+        form = await request.form()
+        upload_file = form["file"]
+        content = await upload_file.read()
+        upsert = request.headers.get("x-upsert", "false") == "true"
+        with lock:
+            if path in fake.buckets.get(bucket, {}) and not (
+                upsert or request.method == "PUT"
+            ):
+                return storage_error(400, "Duplicate", "The resource already exists")
+            fake.put_object(
+                bucket,
+                path,
+                content,
+                upload_file.content_type or "application/octet-stream",
+            )
+        return JSONResponse({"Key": f"{bucket}/{path}"})
+
+    async def download(request: Request):
+        bucket = request.path_params["bucket"]
+        path = request.path_params["path"]
+        fake.count("storage.download")
+        stored = fake.buckets.get(bucket, {}).get(path)
+        if stored is None:
+            return storage_error(404, "not_found", "Object not found")
+        return Response(
+            stored["content"],
+            media_type=stored["content_type"],
+            headers={"etag": f'"{stored["etag"]}"'},
+        )
+
+    async def remove(request: Request):
+        bucket = request.path_params["bucket"]
+        fake.count("storage.remove")
+        prefixes = (await request.json()).get("prefixes", [])
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        removed = []
+        with lock:
+            objects = fake.buckets.get(bucket, {})
+            for path in prefixes:
+                if objects.pop(path, None) is not None:
+                    removed.append({"name": path, "bucket_id": bucket})
+        return JSONResponse(removed)
+
+    async def list_objects(request: Request):
+        bucket = request.path_params["bucket"]
+        fake.count("storage.list")
+        body = await request.json()
+        prefix = body.get("prefix", "")
+        offset = body.get("offset", 0)
+        limit = body.get("limit", 100)
+        names = sorted(
+            name for name in fake.buckets.get(bucket, {}) if name.startswith(prefix)
+        )
+        files = []
+        for name in names[offset : offset + limit]:
+            stored = fake.buckets[bucket][name]
+            files.append(
+                {
+                    "name": name[len(prefix) :].lstrip("/"),
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{bucket}/{name}")),
+                    "updated_at": stored["updated_at"],
+                    "metadata": {
+                        "eTag": f'"{stored["etag"]}"',
+                        "size": len(stored["content"]),
+                        "mimetype": stored["content_type"],
+                    },
+                }
+            )
+        return JSONResponse(files)
+
+    async def copy(request: Request):
+        fake.count("storage.copy")
+        body = await request.json()
+        bucket = body["bucketId"]
+        with lock:
+            stored = fake.buckets.get(bucket, {}).get(body["sourceKey"])
+            if stored is None:
+                return storage_error(404, "not_found", "Object not found")
+            fake.put_object(
+                bucket,
+                body["destinationKey"],
+                stored["content"],
+                stored["content_type"],
+            )
+        return JSONResponse({"Key": f"{bucket}/{body['destinationKey']}"})
+
+    async def move(request: Request):
+        fake.count("storage.move")
+        body = await request.json()
+        bucket = body["bucketId"]
+        with lock:
+            stored = fake.buckets.get(bucket, {}).pop(body["sourceKey"], None)
+            if stored is None:
+                return storage_error(404, "not_found", "Object not found")
+            fake.buckets[bucket][body["destinationKey"]] = stored
+        return JSONResponse({"message": "Successfully moved"})
+
+    async def user(request: Request):
+        fake.count("auth.user")
+        token = request.headers.get("authorization", "").replace("Bearer ", "")
+        user_id = _user_id(token)
+        if user_id is None:
+            return JSONResponse({"msg": "invalid JWT"}, status_code=401)
+        return JSONResponse(
+            {
+                "id": user_id,
+                "aud": "authenticated",
+                "role": "authenticated",
+                "app_metadata": {},
+                "user_metadata": {},
+                "created_at": "2023-01-01T00:00:00+00:00",
+            }
+        )
+
+    app = Starlette(
+        routes=[
+            Route("/rest/v1/rpc/{function}", rpc, methods=["POST"]),
+            Route(
+                "/rest/v1/{table}",
+                rest,
+                methods=["GET", "HEAD", "POST", "PATCH", "DELETE"],
+            ),
+            Route("/storage/v1/object/list/{bucket}", list_objects, methods=["POST"]),
+            Route("/storage/v1/object/copy", copy, methods=["POST"]),
+            Route("/storage/v1/object/move", move, methods=["POST"]),
+            Route(
+                "/storage/v1/object/public/{bucket}/{path:path}",
+                download,
+                methods=["GET"],
+            ),
+            Route(
+                "/storage/v1/object/{bucket}/{path:path}",
+                upload,
+                methods=["POST", "PUT"],
+            ),
+            Route("/storage/v1/object/{bucket}/{path:path}", download, methods=["GET"]),
+            Route("/storage/v1/object/{bucket}", remove, methods=["DELETE"]),
+            Route("/auth/v1/user", user, methods=["GET"]),
+        ]
+    )
+    app.state.fake = fake
+    return app
+
+
+def _user_id(token):
+    if token.startswith("user-"):
+        return token[len("user-") :]
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        padded = parts[1] + "=" * (-len(parts[1]) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded)).get("sub")
+    except ValueError:
+        return None
+
+
+class LatencyMiddleware:
+    def __init__(self, app, delay=0.0, services=None, jitter=0.0):
+        self.app = app
+        self.delay = delay
+        # service (the first path segment: rest, storage, auth) -> seconds
+        self.services = services or {}
+        # each delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+        self.jitter = jitter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            service = scope["path"].split("/")[1]
+            delay = self.services.get(service, self.delay)
+            if delay and self.jitter:
+                delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+        await self.app(scope, receive, send)
+
+
+def parse_latency(text):
+    # "0.02" or "0.02,storage=0.05,auth=0" -> (default delay, per service delays)
+    delay = 0.0
+    services = {}
+    for part in filter(None, (text or "").split(",")):
+        service, _, value = part.rpartition("=")
+        if service:
+            services[service] = float(value)
+        else:
+            delay = float(value)
+    return delay, services
+
+
+def add_latency(app, latency, jitter=0.0):
+    delay, services = parse_latency(latency)
+    if delay or services:
+        app.add_middleware(
+            LatencyMiddleware, delay=delay, services=services, jitter=jitter
+        )
+    return app
+
+
+def serve_in_thread(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument(
+        "--latency", help="seconds per response, e.g. 0.02 or 0.02,storage=0.05"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+    app = add_latency(create_app(), args.latency, args.jitter)
+    uvicorn.run(app, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""End-to-end load test of main.app against benchmarks.fake_supabase.
+
+Seeds --users users with a business card and a digital card each through the
+API, then replays a mixed workload with --concurrency clients. The requests
+go through the whole app, including add_authentication and both GraphQL
+routers, and the report gives throughput plus p50/p95/p99 latency per
+operation. By default the app runs in-process with the fake Supabase on
+--port, and --latency adds a delay to each fake response (e.g. 0.02 or
+0.01,storage=0.04, see fake_supabase.parse_latency). With --url the
+requests go to an already running server instead, which must be pointed at
+a fake Supabase itself.
+
+Workloads are JSONL, one operation per line:
+
+    {"op": "public", "slug": "load-3"}             digitalCards on /publicgraphql
+    {"op": "list", "user": 3}                      the user's business and digital cards
+    {"op": "create", "user": 3, "full_name": "x"}  create_business_card (renders)
+    {"op": "update", "user": 3, "full_name": "y"}  update_business_card on the seeded card
+    {"op": "graphql", "user": 3, "path": "/graphql", "query": "...", "variables": {}}
+
+"user" is a seeded user's number (users 0 to --users - 1), and "graphql" sends
+any query, without a token when "user" is left out. Without --replay a
+workload of --requests operations is generated from --mix, and --record
+saves it for later runs:
+
+    python -m benchmarks.load_test [--requests 2000] [--concurrency 16]
+        [--mix public=60,list=20,create=10,update=10] [--latency 0.02]
+        [--record workload.jsonl | --replay workload.jsonl] [--output load.json]
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import time
+import httpx
+from PIL import Image
+from benchmarks.fake_supabase import add_latency, create_app, serve_in_thread
+
+TEMPLATE_SIZES = {"Business-Card-1.png": (1050, 600), "BusinessCard.png": (600, 350)}
+DEFAULT_MIX = "public=60,list=20,create=10,update=10"
+# share of public lookups for a slug nobody has, like stale or mistyped links
+MISSING_SLUGS = 0.1
+
+PUBLIC = """
+query ($slug: String!) {
+  digitalCards(slug: $slug) {
+    __typename
+    ... on DigitalCard { id slug fullName jobTitle email qrCode }
+    ... on NotFoundError { message }
+  }
+}
+"""
+LIST = """
+query {
+  business_cards { id full_name job_title image_url thumbnail_url }
+  digital_cards { id slug full_name qr_code }
+}
+"""
+CREATE = """
+mutation ($full_name: String!, $base_card: String!) {
+  create_business_card(email: "load@example.com", job_title: "Engineer",
+    full_name: $full_name, phone_number: "555-0100",
+    website: "https://example.com", base_card: $base_card) {
+    __typename
+    ... on BusinessCard { id image_url }
+  }
+}
+"""
+UPDATE = """
+mutation ($id: Int!, $full_name: String) {
+  update_business_card(id: $id, full_name: $full_name) {
+    __typename
+    ... on UpdateBusinessCardSuccess { business_card { id image_url } }
+  }
+}
+"""
+CREATE_DIGITAL = """
+mutation ($slug: String!, $full_name: String!) {
+  create_digital_card(slug: $slug, full_name: $full_name, job_title: "Engineer",
+    email: "load@example.com", phone_number: "555-0100",
+    website: "https://example.com", profile_pic: "") { id }
+}
+"""
+
+
+def token(user):
+    return f"user-load-{user}"
+
+
+def slug(user):
+    return f"load-{user}"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        mix[op.strip()] = float(weight)
+    unknown = set(mix) - {"public", "list", "create", "update"}
+    if unknown:
+        raise SystemExit(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def generate(requests, users, mix, seed):
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    names = itertools.count()
+    workload = []
+    for op in rng.choices(ops, weights, k=requests):
+        user = rng.randrange(users)
+        if op == "public":
+            missing = rng.random() < MISSING_SLUGS
+            workload.append(
+                {"op": op, "slug": f"missing-{user}" if missing else slug(user)}
+            )
+        elif op == "list":
+            workload.append({"op": op, "user": user})
+        else:
+            # distinct names, so every create and update really renders
+            workload.append(
+                {"op": op, "user": user, "full_name": f"Load {next(names)}"}
+            )
+    return workload
+
+
+def build_request(operation, card_ids):
+    # path, token (or None) and GraphQL body for one workload line
+    op = operation["op"]
+    user = operation.get("user")
+    if op == "public":
+        return (
+            "/publicgraphql",
+            None,
+            {"query": PUBLIC, "variables": {"slug": operation["slug"]}},
+        )
+    if op == "list":
+        return "/graphql", token(user), {"query": LIST}
+    if op == "create":
+        base_card = list(TEMPLATE_SIZES)[user % len(TEMPLATE_SIZES)]
+        variables = {"full_name": operation["full_name"], "base_card": base_card}
+        return "/graphql", token(user), {"query": CREATE, "variables": variables}
+    if op == "update":
+        variables = {"id": card_ids[user], "full_name": operation["full_name"]}
+        return "/graphql", token(user), {"query": UPDATE, "variables": variables}
+    if op == "graphql":
+        body = {"query": operation["query"], "variables": operation.get("variables")}
+        return operation["path"], None if user is None else token(user), body
+    raise ValueError(f"Unknown workload operation {op}")
+
+
+async def send(client, path, user_token, body):
+    headers = {"Authorization": f"Bearer {user_token}"} if user_token else {}
+    response = await client.post(path, json=body, headers=headers, timeout=None)
+    ok = response.status_code == 200 and "errors" not in response.json()
+    return ok, response
+
+
+async def seed(client, users):
+    # one business card and one digital card per user, returns their card ids
+    async def seed_user(user):
+        ok, response = await send(
+            client,
+            "/graphql",
+            token(user),
+            {
+                "query": CREATE,
+                "variables": {
+                    "full_name": f"Seed {user}",
+                    "base_card": list(TEMPLATE_SIZES)[user % len(TEMPLATE_SIZES)],
+                },
+            },
+        )
+        assert ok, response.text
+        card_id = response.json()["data"]["create_business_card"]["id"]
+        ok, response = await send(
+            client,
+            "/graphql",
+            token(user),
+            {
+                "query": CREATE_DIGITAL,
+                "variables": {"slug": slug(user), "full_name": f"Seed {user}"},
+            },
+        )
+        assert ok, response.text
+        return card_id
+
+    return list(await asyncio.gather(*(seed_user(user) for user in range(users))))
+
+
+async def replay(client, workload, card_ids, concurrency):
+    results = []
+    pending = iter(workload)
+
+    async def worker():
+        for operation in pending:
+            path, user_token, body = build_request(operation, card_ids)
+            start = time.perf_counter()
+            try:
+                ok, _ = await send(client, path, user_token, body)
+            except httpx.HTTPError:
+                ok = False
+            results.append((operation["op"], time.perf_counter() - start, ok))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def percentile(ordered, fraction):
+    # nearest rank
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(results, elapsed):
+    by_op = {}
+    for op, seconds, ok in results:
+        by_op.setdefault(op, []).append((seconds, ok))
+    by_op["all"] = [(seconds, ok) for _, seconds, ok in results]
+    summary = {}
+    for op, samples in by_op.items():
+        ordered = sorted(seconds * 1000 for seconds, _ in samples)
+        summary[op] = {
+            "requests": len(samples),
+            "errors": sum(not ok for _, ok in samples),
+            "throughput": len(samples) / elapsed,
+            "p50_ms": percentile(ordered, 0.50),
+            "p95_ms": percentile(ordered, 0.95),
+            "p99_ms": percentile(ordered, 0.99),
+            "max_ms": ordered[-1],
+        }
+    return summary
+
+
+def print_summary(summary, elapsed):
+    print(
+        f"{'operation':<10} {'requests':>9} {'errors':>7} {'req/s':>8}"
+        f" {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+    )
+    for op, row in summary.items():
+        print(
+            f"{op:<10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>8.1f}"
+            f" {row['p50_ms']:>6.1f} ms {row['p95_ms']:>6.1f} ms"
+            f" {row['p99_ms']:>6.1f} ms {row['max_ms']:>6.1f} ms"
+        )
+    print(f"\n{summary['all']['requests']} requests in {elapsed:.2f} s")
+
+
+async def run(client, workload, users, concurrency):
+    async with client:
+        card_ids = await seed(client, users)
+        results, elapsed = await replay(client, workload, card_ids, concurrency)
+    return summarize(results, elapsed), elapsed
+
+
+def load_workload(args):
+    if args.replay:
+        with open(args.replay) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    workload = generate(args.requests, args.users, parse_mix(args.mix), args.seed)
+    if args.record:
+        with open(args.record, "w") as f:
+            f.writelines(json.dumps(operation) + "\n" for operation in workload)
+    return workload
+
+
+def start_fake_supabase(port, latency=None, jitter=0.0):
+    # serves the fake with both templates and points main at it, import main after
+    fake_app = create_app()
+    for template, size in TEMPLATE_SIZES.items():
+        image = io.BytesIO()
+        Image.new("RGB", size, "white").save(image, "PNG")
+        fake_app.state.fake.put_object("default_cards", template, image.getvalue())
+    server = serve_in_thread(add_latency(fake_app, latency, jitter), port)
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["SUPABASE_KEY"] = "fake.supabase.key"
+    os.environ.setdefault("ORIGINS", "*")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54336)
+    parser.add_argument("--url", help="load a running server instead of main.app")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", help="fake Supabase delay, e.g. 0.02")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--record", help="write the generated workload here")
+    parser.add_argument("--replay", help="JSONL workload to replay")
+    parser.add_argument("--output", help="write the summary as JSON")
+    args = parser.parse_args()
+
+    workload = load_workload(args)
+    # a replayed workload may refer to more users than --users
+    users = max([args.users, *(operation.get("user", 0) + 1 for operation in workload)])
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+        summary, elapsed = asyncio.run(run(client, workload, users, args.concurrency))
+    else:
+        server = start_fake_supabase(args.port, args.latency, args.jitter)
+        import main as api
+
+        async def in_process():
+            async with api.app.router.lifespan_context(api.app):
+                client = httpx.AsyncClient(app=api.app, base_url="http://test")
+                return await run(client, workload, users, args.concurrency)
+
+        summary, elapsed = asyncio.run(in_process())
+        server.should_exit = True
+
+    print_summary(summary, elapsed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"arguments": vars(args), "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
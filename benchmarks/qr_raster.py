@@ -0,0 +1,80 @@
+"""Compare the direct QR rasterizer with qrcode's make_image() + resize().
+
+Run from the repository root:
+
+    python -m benchmarks.qr_raster
+"""
+import timeit
+import numpy as np
+import qrcode
+from utils import qr
+
+SLUG = "https://business-card-frontend.vercel.app/cards/jane-doe"
+WEBSITE = "https://www.example.com/portfolio"
+
+# (name, data, generate_qr_code kwargs) for each place a QR code is rendered
+CASES = [
+    ("digital_code", SLUG, dict(back_color="white")),
+    ("Business-Card-1.png", WEBSITE, dict(back_color="#CCCCCC")),
+    (
+        "BusinessCard.png",
+        WEBSITE,
+        dict(border=4, back_color="white", image_size=(150, 150)),
+    ),
+]
+
+
+def legacy_qr_code(
+    website,
+    box_size=10,
+    border=2,
+    fill_color="black",
+    back_color="#CCCCCC",
+    image_size=(300, 300),
+):
+    qr_code = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr_code.add_data(website)
+    qr_code.make(fit=True)
+    qr_img = qr_code.make_image(fill_color=fill_color, back_color=back_color)
+    return qr_img.resize(image_size)
+
+
+def direct_qr_code(
+    website,
+    box_size=10,
+    border=2,
+    fill_color="black",
+    back_color="#CCCCCC",
+    image_size=(300, 300),
+):
+    return qr._render_qr_code(
+        website, box_size, border, fill_color, back_color, tuple(image_size)
+    )
+
+
+def best_of(func, number=50, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1000
+
+
+def main():
+    print(f"{'case':<22}{'legacy ms':>12}{'direct ms':>12}{'speedup':>10}  identical")
+    for name, data, kwargs in CASES:
+        legacy_image = legacy_qr_code(data, **kwargs)
+        direct_image = direct_qr_code(data, **kwargs)
+        identical = legacy_image.mode == direct_image.mode and np.array_equal(
+            np.asarray(legacy_image), np.asarray(direct_image)
+        )
+        legacy = best_of(lambda: legacy_qr_code(data, **kwargs))
+        direct = best_of(lambda: direct_qr_code(data, **kwargs))
+        print(
+            f"{name:<22}{legacy:>12.3f}{direct:>12.3f}{legacy / direct:>9.2f}x  {identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Parse and validate overhead per GraphQL request, with and without caching.
+
+For a few operations the frontend sends, times graphql-core parsing and
+validation against main's schemas and compares it with a DocumentCache hit.
+Then serves defaultCardImages (answered from memory, so the GraphQL layer
+dominates) through an in-process copy of main.app against
+benchmarks.fake_supabase three ways: the full query with the document cache
+emptied before every request (the old behaviour), the full query with the
+cache, and a persisted query GET that only sends the hash.
+
+Run from the repository root:
+
+    python -m benchmarks.query_overhead [--iterations 2000]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+import httpx
+from PIL import Image
+from benchmarks.fake_supabase import create_app, serve_in_thread
+
+OPERATIONS = {
+    "public digitalCards": (
+        "public",
+        """
+        query ($slug: String!) {
+          digitalCards(slug: $slug) {
+            __typename
+            ... on DigitalCard {
+              id slug fullName jobTitle email phoneNumber website
+              profilePic qrCode qrCodeThumbnail
+            }
+            ... on NotFoundError { message }
+          }
+        }
+        """,
+    ),
+    "business_cards": (
+        "authenticated",
+        """
+        query {
+          business_cards {
+            id full_name job_title email phone_number website
+            base_card image_url thumbnail_url
+          }
+          digital_cards { id slug full_name qr_code qr_code_thumbnail }
+        }
+        """,
+    ),
+    "update_business_card": (
+        "authenticated",
+        """
+        mutation ($id: Int!, $n: String) {
+          update_business_card(id: $id, full_name: $n) {
+            __typename
+            ... on UpdateBusinessCardSuccess {
+              business_card { id image_url thumbnail_url }
+            }
+            ... on NotFoundError { message }
+            ... on NotAuthorizedError { message }
+          }
+        }
+        """,
+    ),
+}
+DEFAULT_CARDS = "{ defaultCardImages }"
+
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def time_operations(api, iterations):
+    from graphql import parse, specified_rules, validate
+    from utils.persisted_queries import documents
+
+    schemas = {"public": api.public_schema, "authenticated": api.authenticated_schema}
+    print(f"{'operation':<22} {'parse+validate':>16} {'cache hit':>12}")
+    for name, (schema_name, query) in OPERATIONS.items():
+        schema = schemas[schema_name]._schema
+        errors = validate(schema, parse(query), specified_rules)
+        assert not errors, errors
+        uncached = per_call(
+            lambda: validate(schema, parse(query), specified_rules), iterations
+        )
+        documents.set((id(schemas[schema_name]), query), (parse(query), []))
+        cached = per_call(
+            lambda: documents.get((id(schemas[schema_name]), query)), iterations
+        )
+        print(f"{name:<22} {uncached:>13.1f} us {cached:>9.1f} us")
+
+
+async def time_requests(api, iterations):
+    from utils.persisted_queries import documents, query_hash
+
+    persisted = json.dumps(
+        {"persistedQuery": {"version": 1, "sha256Hash": query_hash(DEFAULT_CARDS)}}
+    )
+
+    async def full_query(client, clear):
+        if clear:
+            documents.clear()
+        return await client.post("/publicgraphql", json={"query": DEFAULT_CARDS})
+
+    async def hash_only(client, clear):
+        return await client.get("/publicgraphql", params={"extensions": persisted})
+
+    async with api.app.router.lifespan_context(api.app):
+        async with httpx.AsyncClient(app=api.app, base_url="http://test") as client:
+            # registers the hash and warms the template listing
+            response = await client.post(
+                "/publicgraphql",
+                json={"query": DEFAULT_CARDS, "extensions": json.loads(persisted)},
+            )
+            assert "errors" not in response.json(), response.text
+            print()
+            for name, send, clear in (
+                ("no document cache", full_query, True),
+                ("document cache", full_query, False),
+                ("persisted query GET", hash_only, False),
+            ):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    response = await send(client, clear)
+                    assert response.status_code == 200, response.text
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{name:<22} {elapsed / iterations * 1e6:>10.0f} us/request"
+                    f" {iterations / elapsed:>8.0f} requests/s"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54334)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    fake_app = create_app()
+    template = io.BytesIO()
+    Image.new("RGB", (1050, 600), "white").save(template, "PNG")
+    fake_app.state.fake.put_object(
+        "default_cards", "Business-Card-1.png", template.getvalue()
+    )
+    server = serve_in_thread(fake_app, args.port)
+
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["SUPABASE_KEY"] = "fake.supabase.key"
+    os.environ.setdefault("ORIGINS", "*")
+    import main as api
+
+    time_operations(api, args.iterations)
+    asyncio.run(time_requests(api, args.iterations))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Latency of PublicQuery.digital_cards while card renders run concurrently.
+
+Runs main.app in-process against benchmarks.fake_supabase, seeds a few users
+with a digital card each, then sends create_business_card mutations (each one
+renders a distinct card) spread over time while a reader keeps looking up
+digitalCards(slug) on /publicgraphql. Both go through the same event loop, so
+the lookup percentiles show how much the renders hold it up in each
+RENDER_EXECUTOR mode.
+
+Run from the repository root:
+
+    python -m benchmarks.render_latency [--renders 40] [--lookups 200]
+        [--latency 0.002]
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+import httpx
+from benchmarks.load_test import (
+    CREATE,
+    PUBLIC,
+    TEMPLATE_SIZES,
+    percentile,
+    seed,
+    send,
+    slug,
+    start_fake_supabase,
+    token,
+)
+
+
+async def run(client, mode, users, renders, lookups, arrival_interval):
+    from utils import executor
+
+    executor.shutdown_executor()
+    executor.RENDER_EXECUTOR = mode
+    executor.start_executor()
+
+    done = asyncio.Event()
+    names = itertools.count()
+
+    async def create(i):
+        start = time.perf_counter()
+        ok, response = await send(
+            client,
+            "/graphql",
+            token(i % users),
+            {
+                "query": CREATE,
+                "variables": {
+                    # distinct names, so every create really renders
+                    "full_name": f"{mode} {next(names)}",
+                    "base_card": list(TEMPLATE_SIZES)[i % len(TEMPLATE_SIZES)],
+                },
+            },
+        )
+        assert ok, response.text
+        return time.perf_counter() - start
+
+    async def writer():
+        # creates arrive as separate requests spread over time
+        jobs = []
+        for i in range(renders):
+            jobs.append(asyncio.ensure_future(create(i)))
+            await asyncio.sleep(arrival_interval)
+        timings = await asyncio.gather(*jobs)
+        done.set()
+        return timings
+
+    async def reader():
+        timings = []
+        for i in itertools.count():
+            if done.is_set() and len(timings) >= lookups:
+                return timings
+            body = {"query": PUBLIC, "variables": {"slug": slug(i % users)}}
+            start = time.perf_counter()
+            ok, response = await send(client, "/publicgraphql", None, body)
+            assert ok, response.text
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    creates, reads = await asyncio.gather(writer(), reader())
+    elapsed = time.perf_counter() - start
+
+    reads = sorted(seconds * 1000 for seconds in reads)
+    create_p50 = statistics.median(creates) * 1000
+    print(
+        f"{mode:<8} p50 {percentile(reads, 0.5):8.2f} ms"
+        f"  p99 {percentile(reads, 0.99):8.2f} ms  max {reads[-1]:8.2f} ms"
+        f"  create p50 {create_p50:8.2f} ms  wall {elapsed:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54337)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--renders", type=int, default=40)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--arrival-interval", type=float, default=0.005)
+    parser.add_argument(
+        "--latency", default="0.002", help="fake Supabase delay, e.g. 0.002"
+    )
+    args = parser.parse_args()
+
+    server = start_fake_supabase(args.port, args.latency)
+    import main as api
+
+    async def measure():
+        async with api.app.router.lifespan_context(api.app):
+            async with httpx.AsyncClient(app=api.app, base_url="http://test") as client:
+                await seed(client, args.users)
+                print("digitalCards(slug) latency while create mutations render")
+                for mode in ("inline", "thread", "process"):
+                    await run(
+                        client,
+                        mode,
+                        args.users,
+                        args.renders,
+                        args.lookups,
+                        args.arrival_interval,
+                    )
+
+    asyncio.run(measure())
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Render benchmarks and output regression checks for utils/draw_card.
+
+Renders both card templates with field values in each length bucket of the
+layouts' font ladder (up to 20, 30 and 40 characters, and longer), plus
+centered text starting with a glyph that has a negative left bearing, and QR
+codes via generate_qr_code (websites) and digital_code (slugs) of the same
+lengths.
+Like pytest-benchmark, each case is timed over --rounds calls after a warmup
+with its setup left out of the timings (QR caches are emptied first, so every
+call really renders). Reported per case:
+
+- renders/s and min/median/mean/stddev per call
+- peak memory of one call: Python allocations via tracemalloc (numpy arrays,
+  encoded bytes), and on Linux how far the resident set peaked above its
+  starting size once freed heap memory went back to the OS, which also
+  covers Pillow's image buffers that tracemalloc does not see
+- encoded size of each variant
+- a SHA-256 of the decoded pixels, compared against render_golden.json so a
+  Pillow, qrcode or font change that alters the output is caught
+
+Templates are plain white images of the real templates' sizes, so the suite
+runs without Supabase. Exits with status 1 when a hash differs from the
+golden file; --update-golden rewrites it after an intended change.
+--output writes the results as JSON, and --compare prints the speed change
+against such an earlier run:
+
+    python -m benchmarks.render_suite [--rounds 20] [--output render.json]
+        [--compare previous.json] [--update-golden]
+"""
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import importlib.metadata
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from PIL import Image
+from utils.draw_card import digital_code, draw_card
+from utils.encoding import encoding_settings
+from utils.fonts import preload_fonts
+from utils.layout import compile_layouts, layouts
+from utils.qr import generate_qr_code, qr_codes
+
+GOLDEN_FILE = os.path.join(os.path.dirname(__file__), "render_golden.json")
+TEMPLATE_SIZES = {"Business-Card-1.png": (1050, 600), "BusinessCard.png": (600, 350)}
+# a length inside each step of the font ladder (<= 20, <= 30, <= 40, > 40)
+BUCKETS = {"le20": 18, "le30": 28, "le40": 38, "gt40": 52}
+SAMPLE = {
+    "full_name": "Alexandra Catherine Montgomery-Fitzgerald",
+    "job_title": "Principal Software Engineer, Platform Reliability",
+    "email": "alexandra.montgomery-fitzgerald@example-company.com",
+    "phone_number": "+1 (555) 123-4567 ext. 8901 / +44 20 7946 0958",
+    "website": "https://www.example-company.com/people/alexandra-montgomery",
+}
+CARD_URL_PREFIX = "https://business-card-frontend.vercel.app/cards/"
+
+
+def fit(text, length):
+    # text cut or repeated to exactly length characters
+    return (text * (length // len(text) + 1))[:length]
+
+
+def card_values(length):
+    return [fit(SAMPLE[field], length) for field in SAMPLE]
+
+
+def pixel_hash(image):
+    # lossless formats decode to the same pixels whatever the encoder settings
+    if isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+    return hashlib.sha256(image.convert("RGB").tobytes()).hexdigest()
+
+
+def build_cases():
+    # name -> (setup returning the call's arguments, function, outputs of a result)
+    cases = {}
+    for template, size in TEMPLATE_SIZES.items():
+        for bucket, length in BUCKETS.items():
+
+            def setup(template=template, size=size, length=length):
+                qr_codes.clear()
+                base_image = Image.new("RGB", size, "white")
+                return (base_image, template, *card_values(length))
+
+            cases[f"draw_card[{template}-{bucket}]"] = (setup, draw_card, dict)
+
+    def bearing_setup():
+        # "/" starts left of its origin, centered text must count that width too
+        qr_codes.clear()
+        base_image = Image.new("RGB", TEMPLATE_SIZES["Business-Card-1.png"], "white")
+        values = ["/" + value for value in card_values(BUCKETS["le30"])]
+        return (base_image, "Business-Card-1.png", *values)
+
+    cases["draw_card[Business-Card-1.png-bearing]"] = (bearing_setup, draw_card, dict)
+
+    qr = layouts["Business-Card-1.png"].qr
+    for bucket, length in BUCKETS.items():
+        url = fit(SAMPLE["website"], length)
+
+        def qr_setup(url=url):
+            qr_codes.clear()
+            return (
+                url,
+                qr.box_size,
+                qr.border,
+                qr.fill_color,
+                qr.back_color,
+                (qr.size, qr.size),
+            )
+
+        def code_setup(slug=fit("jane-doe-", length)):
+            qr_codes.clear()
+            return (CARD_URL_PREFIX + slug,)
+
+        cases[f"generate_qr_code[{bucket}]"] = (
+            qr_setup,
+            generate_qr_code,
+            lambda image: {"full": image},
+        )
+        cases[f"digital_code[{bucket}]"] = (code_setup, digital_code, dict)
+    return cases
+
+
+def warm_up():
+    preload_fonts()
+    compile_layouts()
+
+
+def time_case(setup, func, rounds, warmup):
+    for _ in range(warmup):
+        func(*setup())
+    timings = []
+    for _ in range(rounds):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def python_peak(setup, func):
+    args = setup()
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _memory_status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+def _release_free_memory():
+    # glibc keeps freed heap memory mapped, which later calls would reuse
+    try:
+        ctypes.CDLL(ctypes.util.find_library("c")).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def rss_growth(setup, func):
+    # KiB the resident set peaked above where it started, None off Linux;
+    # writing 5 to clear_refs resets the peak (VmHWM) to the current size
+    args = setup()
+    _release_free_memory()
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    before = _memory_status("VmRSS:")
+    func(*args)
+    return _memory_status("VmHWM:") - before
+
+
+def run_case(setup, func, outputs, rounds, warmup):
+    timings = time_case(setup, func, rounds, warmup)
+    variants = outputs(func(*setup()))
+    mean = statistics.mean(timings)
+    return {
+        "rounds": rounds,
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "mean_ms": mean * 1000,
+        "stddev_ms": statistics.pstdev(timings) * 1000,
+        "renders_per_s": 1 / mean,
+        "python_peak_kib": python_peak(setup, func) / 1024,
+        "rss_growth_kib": rss_growth(setup, func),
+        "encoded_bytes": {
+            name: len(value) for name, value in variants.items() if type(value) is bytes
+        },
+        "pixel_sha256": {name: pixel_hash(value) for name, value in variants.items()},
+    }
+
+
+def check_golden(results, update):
+    hashes = {name: result["pixel_sha256"] for name, result in results.items()}
+    if update:
+        with open(GOLDEN_FILE, "w") as f:
+            json.dump(hashes, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nwrote {len(hashes)} golden hashes to {GOLDEN_FILE}")
+        return []
+    with open(GOLDEN_FILE) as f:
+        golden = json.load(f)
+    failures = []
+    for name, variants in hashes.items():
+        if name not in golden:
+            failures.append(f"{name}: not in {GOLDEN_FILE}")
+            continue
+        for variant, digest in variants.items():
+            expected = golden[name].get(variant)
+            if expected is None:
+                failures.append(f"{name}: {variant} not in {GOLDEN_FILE}")
+            elif expected != digest:
+                failures.append(f"{name}: {variant} pixels differ from {GOLDEN_FILE}")
+    return failures
+
+
+def compare(results, path):
+    with open(path) as f:
+        previous = json.load(f)["cases"]
+    print(f"\n{'case':<40} {'before':>10} {'after':>10} {'change':>8}")
+    for name, result in results.items():
+        if name in previous:
+            before = previous[name]["median_ms"]
+            after = result["median_ms"]
+            print(
+                f"{name:<40} {before:>7.2f} ms {after:>7.2f} ms"
+                f" {(after / before - 1) * 100:>+7.1f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    parser.add_argument("--update-golden", action="store_true")
+    args = parser.parse_args()
+
+    warm_up()
+    cases = build_cases()
+    results = {}
+    print(
+        f"{'case':<40} {'renders/s':>10} {'median':>10} {'py peak':>10}"
+        f" {'RSS peak':>10} {'full':>9} {'thumb':>9}"
+    )
+    for name, (setup, func, outputs) in cases.items():
+        result = run_case(setup, func, outputs, args.rounds, args.warmup)
+        results[name] = result
+        sizes = result["encoded_bytes"]
+        rss = result["rss_growth_kib"]
+        print(
+            f"{name:<40} {result['renders_per_s']:>10.1f}"
+            f" {result['median_ms']:>7.2f} ms {result['python_peak_kib']:>6.0f} KiB"
+            f" {'-' if rss is None else rss:>6} KiB"
+            f" {sizes.get('full', '-'):>9} {sizes.get('thumbnail', '-'):>9}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        **{
+                            package: importlib.metadata.version(package)
+                            for package in ("Pillow", "numpy", "qrcode")
+                        },
+                        "encoding": encoding_settings(),
+                    },
+                    "cases": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nwrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+    failures = check_golden(results, args.update_golden)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Interleaved requests from many users against one app instance.
+
+Starts benchmarks.fake_supabase with row level security on the card tables,
+seeds cards for every user and fires concurrent business_cards and
+digital_cards queries for all of them through a single in-process copy of
+main.app. Each response must contain only the caller's own cards; any row
+belonging to another user means a token leaked between requests. Exits 1 on
+a leak so it can gate a deploy.
+
+Run from the repository root:
+
+    python -m benchmarks.request_isolation [--users 20] [--requests 1000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import httpx
+from benchmarks.fake_supabase import RLS, FakeSupabase, create_app, serve_in_thread
+
+QUERIES = {
+    "business_cards": "{ business_cards { id user_id } }",
+    "digital_cards": "{ digital_cards { id user_id } }",
+}
+
+
+async def interleave(app, users, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    leaks = []
+
+    async def query(client, user_id, field):
+        async with semaphore:
+            response = await client.post(
+                "/graphql",
+                json={"query": QUERIES[field]},
+                headers={"Authorization": f"Bearer user-{user_id}"},
+            )
+        rows = response.json()["data"][field]
+        if not rows:
+            leaks.append((user_id, field, "no rows"))
+        for row in rows:
+            if row["user_id"] != user_id:
+                leaks.append((user_id, field, row))
+
+    calls = [
+        (random.choice(users), random.choice(list(QUERIES))) for _ in range(requests)
+    ]
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            await asyncio.gather(*(query(client, *call) for call in calls))
+    return leaks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54330)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    fake = FakeSupabase(rls=RLS)
+    users = [f"user{i}" for i in range(args.users)]
+    for user_id in users:
+        card = {
+            "email": f"{user_id}@example.com",
+            "job_title": "Engineer",
+            "full_name": user_id,
+            "phone_number": "555-0100",
+            "website": "https://example.com",
+            "user_id": user_id,
+        }
+        fake.seed(
+            "business_cards",
+            [{**card, "base_card": "BusinessCard.png", "image_url": ""}] * 2,
+        )
+        fake.seed(
+            "digital_cards",
+            [{**card, "slug": user_id, "qr_code": "", "profile_pic": ""}],
+        )
+    server = serve_in_thread(create_app(fake), args.port)
+
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["SUPABASE_KEY"] = "fake.supabase.key"
+    os.environ.setdefault("ORIGINS", "*")
+    import main as api
+
+    start = time.perf_counter()
+    leaks = asyncio.run(interleave(api.app, users, args.requests, args.concurrency))
+    elapsed = time.perf_counter() - start
+    server.should_exit = True
+
+    print(f"{args.requests} requests from {args.users} users in {elapsed:.2f}s")
+    for leak in leaks[:10]:
+        print("leak", *leak)
+    print(f"{len(leaks)} leaked rows")
+    sys.exit(1 if leaks else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Throughput of slug lookups through the sync and the async Supabase clients.
+
+Starts benchmarks.fake_supabase on a local port and runs the same
+digital_cards lookup the public API serves, once with the blocking
+supabase-py client (what every resolver used before) and once with the
+pooled async client from utils.db, both driven from a single event loop.
+
+Run from the repository root:
+
+    python -m benchmarks.supabase_throughput [--requests 500] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import time
+from supabase import create_client as create_sync_client
+from benchmarks.fake_supabase import create_app, serve_in_thread
+from utils.db import create_client
+
+KEY = "fake.supabase.key"
+
+
+async def sync_lookups(url, slugs, concurrency):
+    supabase = create_sync_client(url, KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(slug):
+        async with semaphore:
+            # the blocking call holds the event loop, like the old resolvers did
+            supabase.table("digital_cards").select("*").eq("slug", slug).execute()
+
+    await asyncio.gather(*(lookup(slug) for slug in slugs))
+
+
+async def async_lookups(url, slugs, concurrency):
+    supabase = create_client(url, KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(slug):
+        async with semaphore:
+            await supabase.table("digital_cards").select("*").eq(
+                "slug", slug
+            ).execute()
+
+    try:
+        await asyncio.gather(*(lookup(slug) for slug in slugs))
+    finally:
+        await supabase.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=54329)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.state.fake.seed(
+        "digital_cards",
+        [{"slug": f"card-{i}", "user_id": "bench", "qr_code": ""} for i in range(100)],
+    )
+    server = serve_in_thread(app, args.port)
+    url = f"http://127.0.0.1:{args.port}"
+    slugs = [f"card-{i % 100}" for i in range(args.requests)]
+
+    for name, run in (("sync", sync_lookups), ("async", async_lookups)):
+        start = time.perf_counter()
+        asyncio.run(run(url, slugs, args.concurrency))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<6} {args.requests / elapsed:8.1f} lookups/s")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
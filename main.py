@@ -1,22 +1,131 @@
-from typing import List, Optional
+from enum import Enum
+from typing import Generic, List, Optional, TypeVar
 import strawberry
 from fastapi import FastAPI, Request, Response
-from strawberry.fastapi import GraphQLRouter
-from supabase import create_client, Client
 from strawberry.schema.config import StrawberryConfig
-from PIL import Image
-from utils.draw_card import draw_card, digital_code
+from utils.encoding import (
+    CARD_IMAGE_FORMAT,
+    CONTENT_TYPES,
+    VARIANTS,
+    encoding_settings,
+    variant_path,
+)
+from utils import fonts
+from utils.fonts import preload_fonts
+from utils.cache import slug_cache
+from utils.executor import run_render, shutdown_executor, start_executor
+from utils.http_cache import cache_for, conditional_response
+from utils.jobs import JobWorkers, create_queue
+from utils.layout import compile_layouts, get_layout, layouts
+from utils.metrics import (
+    METRICS_ENABLED,
+    MetricsExtension,
+    lru_stats,
+    metrics_endpoint,
+    phase,
+    record_request,
+    register_stats,
+)
+from utils.loaders import (
+    ALL_COLUMNS,
+    create_loaders,
+    from_row,
+    is_selected,
+    load_for_mutation,
+    remember_row,
+    selected_columns,
+)
+from utils.pagination import encode_cursor, keyset_page
+from utils.persisted_queries import (
+    DocumentCache,
+    PersistedQueryRouter,
+    documents,
+    persisted_queries,
+    prepare_documents,
+)
+from utils.render_cache import render_cache, render_key
+from utils import storage
+from utils.storage import OrphanCleaner
+from utils.templates import (
+    TEMPLATE_REVALIDATE_SECONDS,
+    get_template,
+    template_names,
+    template_version,
+    templates,
+    warm_templates,
+)
 from dotenv import load_dotenv
+import asyncio
+import functools
+import logging
 import os
-import io
+import uuid
 from fastapi.middleware.cors import CORSMiddleware
 
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 ORIGINS = os.getenv("ORIGINS")
+# matches the business_cards unique constraint in supabase/migrations
+CARD_FIELDS = ("full_name", "job_title", "email", "phone_number", "website")
+CARD_UNIQUE_COLUMNS = "user_id,email,job_title,full_name,phone_number,website,base_card"
+# how long browsers and CDNs may reuse the template picker listing
+DEFAULT_CARDS_MAX_AGE = int(os.getenv("DEFAULT_CARDS_MAX_AGE", "300"))
+# mutations whose target rows are fetched together when a document has several
+BUSINESS_CARD_WRITES = ("update_business_card", "delete_business_card")
+DIGITAL_CARD_WRITES = ("update_digital_card", "delete_digital_card")
+CARD_URL_PREFIX = "https://business-card-frontend.vercel.app/cards/"
+CARD_BATCH_MAX = int(os.getenv("CARD_BATCH_MAX", "1000"))
+# concurrent renders + uploads per batch, renders are further bounded by the pool
+CARD_UPLOAD_CONCURRENCY = int(os.getenv("CARD_UPLOAD_CONCURRENCY", "16"))
+# "inline" renders before the mutation returns, "queue" hands it to render workers
+RENDER_MODE = os.getenv("RENDER_MODE", "inline")
+
+# off for the serverless deployment, where a process starts per cold request and
+# fonts, layouts, templates, clients and persisted queries are left to the
+# requests needing them; long running servers can load them at startup instead
+WARM_ON_STARTUP = os.getenv("WARM_ON_STARTUP", "false").lower() == "true"
+
+_supabase = None
+_token_verifier = None
+
+
+def get_supabase():
+    # built on first use, so requests that never reach Supabase (CORS preflights
+    # for instance) don't pay for importing and creating the clients
+    global _supabase
+    if _supabase is None:
+        from utils.db import create_client
+
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
+# storage is resolved on each removal, so deletes work without the startup hook too
+orphan_cleaner = OrphanCleaner(lambda: get_supabase().storage)
+
+
+def get_token_verifier():
+    global _token_verifier
+    if _token_verifier is None:
+        from utils.auth import (
+            AUTH_REMOTE_FALLBACK,
+            SUPABASE_JWKS_URL,
+            SUPABASE_JWT_SECRET,
+            TokenVerifier,
+        )
+
+        supabase = get_supabase()
+        _token_verifier = TokenVerifier(
+            supabase.auth,
+            jwt_secret=SUPABASE_JWT_SECRET,
+            jwks_url=SUPABASE_JWKS_URL,
+            remote_fallback=AUTH_REMOTE_FALLBACK,
+            transport=supabase.transport,
+        )
+    return _token_verifier
+
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 app = FastAPI()
 
 app.add_middleware(
@@ -28,6 +137,44 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def warm_render_caches():
+    start_executor()
+    if RENDER_MODE == "queue":
+        render_workers.start()
+    orphan_cleaner.start()
+    if not WARM_ON_STARTUP:
+        return
+    get_token_verifier()
+    for schema in (authenticated_schema, public_schema):
+        prepare_documents(schema, persisted_queries.registered.values())
+    preload_fonts()
+    compile_layouts()
+    try:
+        await warm_templates(
+            get_supabase().storage.from_("default_cards"), list(layouts)
+        )
+    except Exception:
+        # templates are fetched on first use instead
+        pass
+
+
+@app.on_event("shutdown")
+async def stop_render_workers():
+    await render_workers.stop()
+    await orphan_cleaner.stop()
+    shutdown_executor()
+    if _supabase is not None:
+        await _supabase.aclose()
+
+
+@strawberry.enum
+class ImageStatus(Enum):
+    PENDING = "PENDING"
+    READY = "READY"
+    FAILED = "FAILED"
+
+
 @strawberry.type
 class BusinessCard:
     id: Optional[int]
@@ -39,6 +186,8 @@ class BusinessCard:
     image_url: Optional[str]
     user_id: str
     base_card: str
+    thumbnail_url: Optional[str] = None
+    image_status: Optional[ImageStatus] = None
 
 
 @strawberry.type
@@ -53,6 +202,17 @@ class DigitalCard:
     slug: str
     qr_code: str
     profile_pic: str
+    qr_code_thumbnail: Optional[str] = None
+
+
+@strawberry.input
+class BusinessCardInput:
+    email: str
+    job_title: str
+    full_name: str
+    phone_number: str
+    website: str
+    base_card: str
 
 
 @strawberry.type
@@ -85,6 +245,36 @@ class DuplicateCardError:
     message: str = "That card already exists"
 
 
+@strawberry.type
+class CardImageError:
+    message: str = "The card image could not be created"
+
+
+Node = TypeVar("Node")
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    has_previous_page: bool
+    start_cursor: Optional[str]
+    end_cursor: Optional[str]
+
+
+@strawberry.type
+class Edge(Generic[Node]):
+    cursor: str
+    node: Node
+
+
+@strawberry.type
+class Connection(Generic[Node]):
+    edges: List[Edge[Node]]
+    page_info: PageInfo
+    # only counted when selected
+    total_count: Optional[int] = None
+
+
 UpdateResponse = strawberry.union(
     "UpdateResponse", [UpdateBusinessCardSuccess, NotFoundError, NotAuthorizedError]
 )
@@ -99,6 +289,24 @@ DigitalCardResponse = strawberry.union(
 )
 
 
+@strawberry.type
+class CardRenderStatus:
+    id: int
+    image_status: ImageStatus
+    image_url: Optional[str]
+    thumbnail_url: Optional[str]
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+CardRenderStatusResponse = strawberry.union(
+    "CardRenderStatusResponse", [CardRenderStatus, NotFoundError]
+)
+CreateBusinessCardResponse = strawberry.union(
+    "CreateBusinessCardResponse", [BusinessCard, DuplicateCardError, CardImageError]
+)
+
+
 @app.middleware("http")
 async def add_authentication(request: Request, call_next):
     if request.url.path.startswith("/graphql"):
@@ -109,59 +317,253 @@ async def add_authentication(request: Request, call_next):
         if not token:
             return Response("Unauthorized", status_code=401)
         try:
-            auth = supabase.auth.get_user(token)
-            request.state.user_id = auth.user.id
-            supabase.postgrest.auth(token)
+            with phase("auth"):
+                request.state.user_id = await get_token_verifier().user_id(token)
+            request.state.token = token
         except Exception:
             return Response("Invalid user token", status_code=401)
     return await call_next(request)
 
 
+@app.middleware("http")
+async def add_conditional_caching(request: Request, call_next):
+    response = await call_next(request)
+    if request.url.path.startswith("/publicgraphql"):
+        return await conditional_response(request, response)
+    return response
+
+
+@functools.lru_cache(maxsize=4)
+def default_card_urls(names):
+    return tuple(public_url("default_cards", name) for name in names)
+
+
+def storage_key(public_url):
+    # object name from a public url, without any cache busting query
+    return public_url.rsplit("/", 1)[-1].split("?", 1)[0]
+
+
+def public_url(bucket, path):
+    return f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{path}"
+
+
+def card_image_paths(stem):
+    return {variant: variant_path(stem, variant) for variant in VARIANTS}
+
+
+def qr_code_paths(stem):
+    return {variant: variant_path(stem, variant, "png") for variant in VARIANTS}
+
+
+async def card_render_key(db, card):
+    base_card = card["base_card"]
+    version = await template_version(db.storage.from_("default_cards"), base_card)
+    values = {field: card[field] for field in CARD_FIELDS}
+    return render_key(
+        base_card,
+        version,
+        get_layout(base_card).version,
+        values,
+        encoding_settings(),
+    )
+
+
+async def render_card_image(db, card, key=None):
+    # the encoded variants, rendered once and then served from the render cache
+    if key is None:
+        key = await card_render_key(db, card)
+    variants = render_cache.get(key)
+    if variants is None:
+        base_image = await get_template(
+            db.storage.from_("default_cards"), card["base_card"]
+        )
+        from utils.draw_card import draw_card
+
+        with phase("render"):
+            variants = await run_render(
+                draw_card,
+                base_image,
+                card["base_card"],
+                card["full_name"],
+                card["job_title"],
+                card["email"],
+                card["phone_number"],
+                card["website"],
+            )
+        render_cache.set(key, variants)
+    return variants
+
+
+async def store_card_image(db, card, paths, overwrite=False, rendered=None):
+    # identical cards render to identical bytes, so reuse an earlier render if we
+    # can; rendered is prerender_card's (key, variants), already looked up once
+    images = db.storage.from_("business_card_images")
+    key, variants = rendered or (await card_render_key(db, card), None)
+    sources = render_cache.location(key)
+    if sources is not None and not overwrite:
+        try:
+            await asyncio.gather(
+                *(
+                    storage.copy(images, sources[variant], paths[variant])
+                    for variant in paths
+                )
+            )
+        except Exception:
+            for source in sources.values():
+                render_cache.forget(source)
+        else:
+            if rendered is None:
+                render_cache.stats["hits"] += 1
+            render_cache.stats["copies"] += 1
+            render_cache.remember(key, paths)
+            return
+
+    if variants is None:
+        variants = await render_card_image(db, card, key)
+    file_options = {"content-type": CONTENT_TYPES[CARD_IMAGE_FORMAT]}
+    if overwrite:
+        file_options["x-upsert"] = "true"
+    await asyncio.gather(
+        *(
+            storage.upload(images, path, variants[variant], file_options)
+            for variant, path in paths.items()
+        )
+    )
+    render_cache.remember(key, paths)
+
+
+async def render_card_job(payload):
+    # jobs may be retried after a partial upload, so they always overwrite
+    await store_card_image(
+        get_supabase(), payload["card"], payload["paths"], overwrite=True
+    )
+
+
+async def set_image_status(payload, status):
+    await (
+        get_supabase()
+        .table("business_cards")
+        .update({"image_status": status})
+        .eq("id", payload["id"])
+        .execute()
+    )
+
+
+render_queue = create_queue()
+render_workers = JobWorkers(
+    render_queue,
+    render_card_job,
+    on_done=lambda payload: set_image_status(payload, "READY"),
+    on_failed=lambda payload: set_image_status(payload, "FAILED"),
+)
+
+
+def pending_image_status():
+    # written with the row when the render happens after the mutation returns
+    return {"image_status": "PENDING"} if RENDER_MODE == "queue" else {}
+
+
+async def prerender_card(db, card):
+    # lets a render overlap the row write it would otherwise wait for; the
+    # upload still happens after the write succeeded
+    if RENDER_MODE != "queue":
+        key = await card_render_key(db, card)
+        return key, await render_card_image(db, card, key)
+
+
+async def discard_cards(db, cards):
+    # undoes creates whose image could not be rendered or stored, cards maps
+    # each row id to its image paths
+    await db.table("business_cards").delete().in_("id", list(cards)).execute()
+    objects = [path for paths in cards.values() for path in paths.values()]
+    for path in objects:
+        render_cache.forget(path)
+    orphan_cleaner.remove_later("business_card_images", objects)
+
+
+async def render_card(db, card_id, card, paths, overwrite=False, rendered=None):
+    if RENDER_MODE != "queue":
+        await store_card_image(db, card, paths, overwrite, rendered)
+        return
+    # one job per stored image, an identical render already queued is reused
+    key = await card_render_key(db, card)
+    card = {field: card[field] for field in (*CARD_FIELDS, "base_card")}
+    await render_queue.put(
+        paths["full"], key, {"id": card_id, "card": card, "paths": paths}
+    )
+
+
+async def render_qr_code(slug):
+    from utils.draw_card import digital_code
+
+    with phase("render"):
+        return await run_render(digital_code, CARD_URL_PREFIX + slug)
+
+
+async def store_qr_code(db, slug, paths, overwrite=False, variants=None):
+    codes = db.storage.from_("digital_card_codes")
+    if variants is None:
+        variants = await render_qr_code(slug)
+    file_options = {"content-type": "image/png"}
+    if overwrite:
+        file_options["x-upsert"] = "true"
+    await asyncio.gather(
+        *(
+            storage.upload(codes, path, variants[variant], file_options)
+            for variant, path in paths.items()
+        )
+    )
+
+
+async def get_context(request: Request):
+    # each request gets its own view of the pooled client carrying its user's token
+    db = get_supabase().scoped(request.state.token)
+    return {"db": db, "loaders": create_loaders(db)}
+
+
+async def get_public_context():
+    db = get_supabase()
+    return {"db": db, "loaders": create_loaders(db)}
+
+
 @strawberry.type
 class PublicQuery:
     @strawberry.field
     async def default_card_images(self, info) -> List[str]:
+        db = info.context["db"]
         try:
-            result = supabase.storage.from_("default_cards").list()
-            if result:
-                return [
-                    f"{SUPABASE_URL}/storage/v1/object/public/default_cards/{file['name']}"
-                    for file in result
-                ]
-
-            return []
-
+            names = await template_names(db.storage.from_("default_cards"))
         except Exception:
             return []
+        cache_for(info, DEFAULT_CARDS_MAX_AGE, TEMPLATE_REVALIDATE_SECONDS)
+        return list(default_card_urls(names))
+
     @strawberry.field
     async def digital_cards(self, info, slug: str) -> DigitalCardResponse:
+        loader = info.context["loaders"]["digital_card_by_slug"]
+
+        async def load():
+            # whole rows, the cached card answers any selection set
+            return await loader.load((slug, ALL_COLUMNS))
+
         try:
-            card = (
-                supabase.table("digital_cards")
-                .select("*")
-                .eq("slug", slug)
-                .execute()
-            )
-            if card.data[0]:
-                return DigitalCard(**card.data[0])
-            else:
-                return NotFoundError()
+            card = await slug_cache.get(slug, load)
         except Exception:
             return NotFoundError()
+        cache_for(info, slug_cache.max_age(card))
+        if card is None:
+            return NotFoundError()
+        return DigitalCard(**card)
 
 @strawberry.type
 class Query:
     @strawberry.field
     async def business_cards(self, info) -> List[BusinessCard]:
         user_id = info.context["request"].state.user_id
+        loader = info.context["loaders"]["business_cards_by_user"]
         try:
-            result = (
-                supabase.table("business_cards")
-                .select("*")
-                .eq("user_id", user_id)
-                .execute()
-            )
-            return [BusinessCard(**card) for card in result.data]
+            cards = await loader.load((user_id, selected_columns(info, BusinessCard)))
+            return [from_row(BusinessCard, card) for card in cards]
 
         except Exception:
             return []
@@ -169,18 +571,73 @@ class Query:
     @strawberry.field
     async def digital_cards(self, info) -> List[DigitalCard]:
         user_id = info.context["request"].state.user_id
+        loader = info.context["loaders"]["digital_cards_by_user"]
         try:
-            result = (
-                supabase.table("digital_cards")
-                .select("*")
-                .eq("user_id", user_id)
-                .execute()
-            )
-            return [DigitalCard(**card) for card in result.data]
+            cards = await loader.load((user_id, selected_columns(info, DigitalCard)))
+            return [from_row(DigitalCard, card) for card in cards]
 
         except Exception:
             return []
 
+    @strawberry.field
+    async def card_render_status(self, info, id: int) -> CardRenderStatusResponse:
+        user_id = info.context["request"].state.user_id
+        loader = info.context["loaders"]["business_card"]
+        card = await loader.load(
+            (id, "id,image_status,image_url,thumbnail_url,user_id")
+        )
+        if card is None or card["user_id"] != user_id:
+            return NotFoundError()
+        # the row is shared by every instance, the job is only known locally
+        job = await render_queue.get(storage_key(card["image_url"])) or {}
+        return CardRenderStatus(
+            id=id,
+            image_status=card["image_status"] or ImageStatus.READY,
+            image_url=card["image_url"],
+            thumbnail_url=card["thumbnail_url"],
+            attempts=job.get("attempts", 0),
+            error=job.get("error"),
+        )
+
+    @strawberry.field
+    async def business_cards_connection(
+        self, info, first: Optional[int] = None, after: Optional[str] = None
+    ) -> Connection[BusinessCard]:
+        return await card_connection(info, "business_cards", BusinessCard, first, after)
+
+    @strawberry.field
+    async def digital_cards_connection(
+        self, info, first: Optional[int] = None, after: Optional[str] = None
+    ) -> Connection[DigitalCard]:
+        return await card_connection(info, "digital_cards", DigitalCard, first, after)
+
+
+async def card_connection(info, table, card_type, first, after):
+    user_id = info.context["request"].state.user_id
+    rows, has_next_page, total_count = await keyset_page(
+        info.context["db"],
+        table,
+        user_id,
+        selected_columns(info, card_type, path=("edges", "node")),
+        first,
+        after,
+        with_count=is_selected(info, "total_count"),
+    )
+    edges = [
+        Edge(cursor=encode_cursor(row["id"]), node=from_row(card_type, row))
+        for row in rows
+    ]
+    return Connection(
+        edges=edges,
+        page_info=PageInfo(
+            has_next_page=has_next_page,
+            has_previous_page=after is not None,
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+        ),
+        total_count=total_count,
+    )
+
 
 @strawberry.type
 class Mutation:
@@ -196,74 +653,124 @@ class Mutation:
         base_card: str,
     ) -> BusinessCard:
         user_id = info.context["request"].state.user_id
-        check_duplicate = (
-            supabase.table("business_cards")
-            .select("*")
-            .eq("email", email)
-            .eq("job_title", job_title)
-            .eq("full_name", full_name)
-            .eq("phone_number", phone_number)
-            .eq("website", website)
-            .eq("base_card", base_card)
-            .execute()
+        db = info.context["db"]
+        # unknown templates fail before anything is written
+        get_layout(base_card)
+        # the storage key is known up front, so the row is written once with its
+        # final image_url and the unique constraint on the card fields does the dedup
+        paths = card_image_paths(uuid.uuid4().hex)
+        new_card = {
+            "email": email,
+            "job_title": job_title,
+            "full_name": full_name,
+            "phone_number": phone_number,
+            "website": website,
+            "user_id": user_id,
+            "image_url": public_url("business_card_images", paths["full"]),
+            "thumbnail_url": public_url("business_card_images", paths["thumbnail"]),
+            "base_card": base_card,
+            **pending_image_status(),
+        }
+        inserted, prerendered = await asyncio.gather(
+            db.table("business_cards")
+            .upsert(new_card, ignore_duplicates=True, on_conflict=CARD_UNIQUE_COLUMNS)
+            .execute(),
+            prerender_card(db, new_card),
+            return_exceptions=True,
         )
-        if check_duplicate.data:
-            return DuplicateCardError()
+        if isinstance(inserted, Exception):
+            raise inserted
+        if not inserted.data:
+            raise ValueError(DuplicateCardError().message)
+
+        card_id = inserted.data[0]["id"]
+        try:
+            if isinstance(prerendered, Exception):
+                raise prerendered
+            await render_card(db, card_id, new_card, paths, rendered=prerendered)
+        except Exception:
+            # a row whose image never gets stored would block retrying the card
+            await discard_cards(db, {card_id: paths})
+            raise
 
-        # if it doesnt already exist make one
-        if check_duplicate.data == []:
+        return BusinessCard(**inserted.data[0])
+
+    @strawberry.mutation
+    async def create_business_cards(
+        self, info, inputs: List[BusinessCardInput]
+    ) -> List[CreateBusinessCardResponse]:
+        user_id = info.context["request"].state.user_id
+        db = info.context["db"]
+        if len(inputs) > CARD_BATCH_MAX:
+            raise ValueError(f"At most {CARD_BATCH_MAX} cards can be created at once")
+        for card_input in inputs:
+            # unknown templates fail the whole batch before anything is written
+            get_layout(card_input.base_card)
+
+        # one upsert for the whole batch, rows the unique constraint already has
+        # (or that repeat earlier inputs) don't come back and are reported as duplicates
+        new_cards = []
+        seen = set()
+        for card_input in inputs:
+            paths = card_image_paths(uuid.uuid4().hex)
             new_card = {
-                "email": email,
-                "job_title": job_title,
-                "full_name": full_name,
-                "phone_number": phone_number,
-                "website": website,
+                "email": card_input.email,
+                "job_title": card_input.job_title,
+                "full_name": card_input.full_name,
+                "phone_number": card_input.phone_number,
+                "website": card_input.website,
                 "user_id": user_id,
-                "image_url": "placeholder",
-                "base_card": base_card,
+                "image_url": public_url("business_card_images", paths["full"]),
+                "thumbnail_url": public_url("business_card_images", paths["thumbnail"]),
+                "base_card": card_input.base_card,
+                **pending_image_status(),
             }
-            # insert into db with placeholder image_url so we can get the correct id for the image
-            table_no_img = supabase.table("business_cards").insert(new_card).execute()
-            id = table_no_img.data[0]["id"]
-
-            # Now we know the id, we can generate the actual image_url
-            image_url = (
-                f"{SUPABASE_URL}/storage/v1/object/public/business_card_images/{id}.png"
+            fields = tuple(
+                new_card[column] for column in CARD_UNIQUE_COLUMNS.split(",")
             )
+            new_cards.append((paths, new_card if fields not in seen else None))
+            seen.add(fields)
 
-            # Update the record with the actual image_url
-            table_with_img = (
-                supabase.table("business_cards")
-                .update({"image_url": image_url})
-                .match({"id": id})
+        rows = [new_card for _, new_card in new_cards if new_card is not None]
+        inserted = {}
+        if rows:
+            result = await (
+                db.table("business_cards")
+                .upsert(rows, ignore_duplicates=True, on_conflict=CARD_UNIQUE_COLUMNS)
                 .execute()
             )
+            inserted = {row["image_url"]: row for row in result.data}
 
-            # Load the base business card image
-            response = supabase.storage.from_("default_cards").download(base_card)
-            img_io = io.BytesIO(response)
-            base_image = Image.open(img_io)
-
-            # Draw the new card
-            img_io = draw_card(
-                base_image,
-                base_card,
-                full_name,
-                job_title,
-                email,
-                phone_number,
-                website,
-            )
+        semaphore = asyncio.Semaphore(CARD_UPLOAD_CONCURRENCY)
 
-            # Upload the modified image to Supabase storage
-            supabase.storage.from_("business_card_images").upload(
-                f"{id}.png", img_io.getvalue()
-            )
-            image_url = (
-                f"{SUPABASE_URL}/storage/v1/object/public/business_card_images/{id}.png"
-            )
+        async def store(paths, card):
+            async with semaphore:
+                await render_card(db, card["id"], card, paths)
 
-            return BusinessCard(**table_with_img.data[0])
+        results = []
+        stored = []
+        for paths, new_card in new_cards:
+            row = inserted.get(new_card["image_url"]) if new_card else None
+            if row is None:
+                results.append(DuplicateCardError())
+            else:
+                stored.append((len(results), paths, row))
+                results.append(BusinessCard(**row))
+        # a card whose image fails is reported and rolled back on its own
+        outcomes = await asyncio.gather(
+            *(store(paths, row) for _, paths, row in stored), return_exceptions=True
+        )
+        failed = {}
+        for (index, paths, row), outcome in zip(stored, outcomes):
+            if isinstance(outcome, Exception):
+                logging.getLogger(__name__).error(
+                    "Storing the image of card %s failed", row["id"], exc_info=outcome
+                )
+                results[index] = CardImageError()
+                failed[row["id"]] = paths
+        if failed:
+            await discard_cards(db, failed)
+        return results
 
     @strawberry.mutation
     async def update_business_card(
@@ -278,97 +785,93 @@ class Mutation:
         base_card: Optional[str] = None,
     ) -> UpdateResponse:
         user_id = info.context["request"].state.user_id
+        db = info.context["db"]
         # Check if the card exists and belongs to the current user
-        result = supabase.table("business_cards").select("*").eq("id", id).execute()
-        if not result.data:
+        card = await load_for_mutation(info, "business_card", BUSINESS_CARD_WRITES, id)
+        if card is None:
             return NotFoundError()
-        elif result.data[0]["user_id"] != user_id:
+        if card["user_id"] != user_id:
             return NotAuthorizedError(
                 message="Not authorized to update this business card"
             )
-        else:
-            # Delete the card
-            supabase.table("business_cards").delete().eq("id", id).execute()
-
-            # Remove the current image from the bucket
-            filename = result.data[0]["image_url"].rsplit("/", 1)[-1]
-            supabase.storage.from_("business_card_images").remove(filename)
+        requested = {
+            "email": email,
+            "job_title": job_title,
+            "full_name": full_name,
+            "phone_number": phone_number,
+            "website": website,
+            "base_card": base_card,
+        }
+        changes = {
+            field: value
+            for field, value in requested.items()
+            if value is not None and value != card[field]
+        }
+        if not changes:
+            return UpdateBusinessCardSuccess(business_card=BusinessCard(**card))
 
-            # Prepare the new card data
-            new_card_data = {
-                "email": email if email is not None else result.data[0]["email"],
-                "job_title": job_title
-                if job_title is not None
-                else result.data[0]["job_title"],
-                "full_name": full_name
-                if full_name is not None
-                else result.data[0]["full_name"],
-                "phone_number": phone_number
-                if phone_number is not None
-                else result.data[0]["phone_number"],
-                "website": website
-                if website is not None
-                else result.data[0]["website"],
-                "user_id": user_id,
-                "image_url": "placeholder",
-                "base_card": base_card
-                if base_card is not None
-                else result.data[0]["base_card"],
+        new_card = {**card, **changes}
+        layout = get_layout(new_card["base_card"])
+        redraw = "base_card" in changes or changes.keys() & layout.visible_fields
+        if redraw:
+            # the objects are overwritten in place, the version query busts cached copies
+            full = storage_key(card["image_url"])
+            paths = {
+                "full": full,
+                "thumbnail": storage_key(card["thumbnail_url"])
+                if card.get("thumbnail_url")
+                else variant_path(full.rsplit(".", 1)[0], "thumbnail"),
             }
+            version = (await card_render_key(db, new_card))[:12]
+            for variant, column in (
+                ("full", "image_url"),
+                ("thumbnail", "thumbnail_url"),
+            ):
+                changes[column] = (
+                    public_url("business_card_images", paths[variant]) + f"?v={version}"
+                )
+            changes.update(pending_image_status())
 
-            # Insert the new card into the database
-            new_card = supabase.table("business_cards").insert(new_card_data).execute()
-            new_id = new_card.data[0]["id"]
-
-            # Load the base business card image
-            response = supabase.storage.from_("default_cards").download(base_card)
-            img_io = io.BytesIO(response)
-            base_image = Image.open(img_io)
-
-            # Draw the new card
-            img_io = draw_card(
-                base_image,
-                base_card,
-                new_card_data["full_name"],
-                new_card_data["job_title"],
-                new_card_data["email"],
-                new_card_data["phone_number"],
-                new_card_data["website"],
-            )
-
-            # Upload the modified image to Supabase storage
-            path = f"{new_id}.png"
-            supabase.storage.from_("business_card_images").upload(
-                path, img_io.getvalue()
-            )
-
-            # Update the image_url in the new_card_data
-            image_url = f"{SUPABASE_URL}/storage/v1/object/public/business_card_images/{new_id}.png"
-            supabase.table("business_cards").update({"image_url": image_url}).eq(
-                "id", new_id
-            ).execute()
+        if redraw and RENDER_MODE != "queue":
+            # stored before the row points at the new version, so a failed render
+            # or upload leaves the row as it was and a retry redraws the card
+            await render_card(db, id, new_card, paths, overwrite=True)
+        updated = await (
+            db.table("business_cards").update(changes).eq("id", id).execute()
+        )
+        remember_row(info, "business_card", id, updated.data[0])
+        if redraw and RENDER_MODE == "queue":
+            # the job reports back on the row, so it is queued once the row is written
+            await render_card(db, id, new_card, paths, overwrite=True)
 
-            return UpdateBusinessCardSuccess(
-                business_card=BusinessCard(**new_card.data[0])
-            )
+        return UpdateBusinessCardSuccess(business_card=BusinessCard(**updated.data[0]))
 
     @strawberry.mutation
     async def delete_business_card(self, info, id: int) -> DeleteResponse:
         user_id = info.context["request"].state.user_id
+        db = info.context["db"]
         # Check if the card exists and belongs to the current user
-        result = supabase.table("business_cards").select("*").eq("id", id).execute()
-        if not result.data:
+        card = await load_for_mutation(info, "business_card", BUSINESS_CARD_WRITES, id)
+        if card is None:
             return NotFoundError()
-        elif result.data[0]["user_id"] != user_id:
+        elif card["user_id"] != user_id:
             return NotAuthorizedError(
                 message="Not authorized to delete this business card"
             )
         else:
-            # Delete the image from the bucket
-            filename = result.data[0]["image_url"].rsplit("/", 1)[-1]
-            supabase.storage.from_(f"business_card_images").remove(filename)
+            filenames = [
+                storage_key(card[column])
+                for column in ("image_url", "thumbnail_url")
+                if card.get(column)
+            ]
+            await render_queue.cancel(storage_key(card["image_url"]))
             # Delete the entry from the table
-            supabase.table("business_cards").delete().eq("id", id).execute()
+            await db.table("business_cards").delete().eq("id", id).execute()
+            remember_row(info, "business_card", id, None)
+            for filename in filenames:
+                render_cache.forget(filename)
+            # the images go once nothing points at them, off the request path
+            orphan_cleaner.remove_later("business_card_images", filenames)
             return DeleteSuccess(message=f"Deleted card {id}")
 
     @strawberry.mutation
@@ -384,7 +887,8 @@ class Mutation:
         slug: str,
     ) -> DigitalCard:
         user_id = info.context["request"].state.user_id
-        complete_slug = "https://business-card-frontend.vercel.app/cards/" + slug
+        db = info.context["db"]
+        paths = qr_code_paths(uuid.uuid4().hex)
         new_card = {
             "email": email,
             "job_title": job_title,
@@ -394,24 +898,18 @@ class Mutation:
             "user_id": user_id,
             "profile_pic": profile_pic,
             "slug": slug,
-            "qr_code": "placeholder",
+            "qr_code": public_url("digital_card_codes", paths["full"]),
+            "qr_code_thumbnail": public_url("digital_card_codes", paths["thumbnail"]),
         }
-        table_no_code = supabase.table("digital_cards").insert(new_card).execute()
-        id = table_no_code.data[0]["id"]
-        code = digital_code(complete_slug)
-        supabase.storage.from_("digital_card_codes").upload(
-            f"{id}.png", code.getvalue()
-        )
-        code_url = (
-            f"{SUPABASE_URL}/storage/v1/object/public/digital_card_codes/{id}.png"
+        inserted, variants = await asyncio.gather(
+            db.table("digital_cards").insert(new_card).execute(), render_qr_code(slug)
         )
-        table_with_code = (
-            supabase.table("digital_cards")
-            .update({"qr_code": code_url})
-            .match({"id": id})
-            .execute()
+        # the slug may be cached as unknown
+        await asyncio.gather(
+            slug_cache.invalidate(slug),
+            store_qr_code(db, slug, paths, variants=variants),
         )
-        return DigitalCard(**table_with_code.data[0])
+        return DigitalCard(**inserted.data[0])
 
     @strawberry.mutation
     async def update_digital_card(
@@ -427,63 +925,79 @@ class Mutation:
         slug: Optional[str] = None,
     ) -> UpdateDigitalResponse:
         user_id = info.context["request"].state.user_id
+        db = info.context["db"]
         # Check if the card exists and belongs to the current user
-        result = supabase.table("digital_cards").select("*").eq("id", id).execute()
-        if not result.data:
+        card = await load_for_mutation(info, "digital_card", DIGITAL_CARD_WRITES, id)
+        if card is None:
             return NotFoundError()
-        elif result.data[0]["user_id"] != user_id:
+        elif card["user_id"] != user_id:
             return NotAuthorizedError(
                 message="Not authorized to update this digital card"
             )
         else:
-            slug_changed = slug is not None and slug != result.data[0]["slug"]
+            slug_changed = slug is not None and slug != card["slug"]
 
             if slug_changed:
-                # Delete the old qr_code
-                filename = result.data[0]["qr_code"].rsplit("/", 1)[-1]
-                supabase.storage.from_("digital_card_codes").remove(filename)
+                # the old qr_code is removed once the row points at the new one
+                filenames = [
+                    storage_key(card[column])
+                    for column in ("qr_code", "qr_code_thumbnail")
+                    if card.get(column)
+                ]
+                paths = qr_code_paths(uuid.uuid4().hex)
 
             # Prepare the new card data
-            print(result.data[0])
-            print("profile pic= ",profile_pic)
             new_card_data = {
-                "email": email if email is not None else result.data[0]["email"],
+                "email": email if email is not None else card["email"],
                 "job_title": job_title
                 if job_title is not None
-                else result.data[0]["job_title"],
+                else card["job_title"],
                 "full_name": full_name
                 if full_name is not None
-                else result.data[0]["full_name"],
+                else card["full_name"],
                 "phone_number": phone_number
                 if phone_number is not None
-                else result.data[0]["phone_number"],
+                else card["phone_number"],
                 "website": website
                 if website is not None
-                else result.data[0]["website"],
-                "profile_pic": profile_pic if profile_pic is not None else result.data[0]["profile_pic"],
+                else card["website"],
+                "profile_pic": profile_pic if profile_pic is not None else card["profile_pic"],
                 "user_id": user_id,
-                "slug": slug if slug is not None else result.data[0]["slug"],
-                "qr_code": "placeholder" if slug_changed else result.data[0]["qr_code"],
+                "slug": slug if slug is not None else card["slug"],
             }
+            if slug_changed:
+                new_card_data["qr_code"] = public_url(
+                    "digital_card_codes", paths["full"]
+                )
+                new_card_data["qr_code_thumbnail"] = public_url(
+                    "digital_card_codes", paths["thumbnail"]
+                )
 
-            # Update the card in the database
-            new_card = (
-                supabase.table("digital_cards")
-                .update(new_card_data)
-                .eq("id", id)
-                .execute()
-            )
+            try:
+                if slug_changed:
+                    # the new qr_code is stored before the row points at it
+                    await store_qr_code(db, new_card_data["slug"], paths)
+                # Update the card in the database
+                new_card = await (
+                    db.table("digital_cards")
+                    .update(new_card_data)
+                    .eq("id", id)
+                    .execute()
+                )
+            except Exception:
+                if slug_changed:
+                    # nothing points at what was stored for the new slug
+                    orphan_cleaner.remove_later(
+                        "digital_card_codes", list(paths.values())
+                    )
+                raise
+            remember_row(info, "digital_card", id, new_card.data[0])
 
+            pending = [slug_cache.invalidate(card["slug"])]
             if slug_changed:
-                # Generate the new qr_code
-                code = digital_code(new_card_data["slug"])
-                supabase.storage.from_("digital_card_codes").upload(
-                    f"{id}.png", code.getvalue()
-                )
-                code_url = f"{SUPABASE_URL}/storage/v1/object/public/digital_card_codes/{id}.png"
-                new_card = supabase.table("digital_cards").update({"qr_code": code_url}).eq(
-                    "id", id
-                ).execute()
+                pending.append(slug_cache.invalidate(new_card_data["slug"]))
+                orphan_cleaner.remove_later("digital_card_codes", filenames)
+            await asyncio.gather(*pending)
 
             return UpdateDigitalCardSuccess(
                 digital_card=DigitalCard(**new_card.data[0])
@@ -492,26 +1006,76 @@ class Mutation:
     @strawberry.mutation
     async def delete_digital_card(self, info, id: int) -> DeleteResponse:
         user_id = info.context["request"].state.user_id
+        db = info.context["db"]
         # Check if the card exists and belongs to the current user
-        result = supabase.table("digital_cards").select("*").eq("id", id).execute()
-        if not result.data:
+        card = await load_for_mutation(info, "digital_card", DIGITAL_CARD_WRITES, id)
+        if card is None:
             return NotFoundError()
-        elif result.data[0]["user_id"] != user_id:
+        elif card["user_id"] != user_id:
             return NotAuthorizedError(
                 message="Not authorized to delete this digital card"
             )
         else:
-            # Delete the qr_code from the bucket
-            filename = result.data[0]["qr_code"].rsplit("/", 1)[-1]
-            supabase.storage.from_(f"digital_card_codes").remove(filename)
+            filenames = [
+                storage_key(card[column])
+                for column in ("qr_code", "qr_code_thumbnail")
+                if card.get(column)
+            ]
             # Delete the entry from the table
-            supabase.table("digital_cards").delete().eq("id", id).execute()
+            await db.table("digital_cards").delete().eq("id", id).execute()
+            remember_row(info, "digital_card", id, None)
+            await slug_cache.invalidate(card["slug"])
+            # the qr_code goes once nothing points at it, off the request path
+            orphan_cleaner.remove_later("digital_card_codes", filenames)
             return DeleteSuccess(message=f"Deleted digital card {id}")
 
 
+schema_extensions = [DocumentCache]
+if METRICS_ENABLED:
+    schema_extensions.append(MetricsExtension)
 authenticated_schema = strawberry.Schema(
-    query=Query, mutation=Mutation, config=StrawberryConfig(auto_camel_case=False)
+    query=Query,
+    mutation=Mutation,
+    config=StrawberryConfig(auto_camel_case=False),
+    extensions=schema_extensions,
+)
+public_schema = strawberry.Schema(query=PublicQuery, extensions=schema_extensions)
+app.include_router(
+    PersistedQueryRouter(schema=authenticated_schema, context_getter=get_context),
+    prefix="/graphql",
+)
+app.include_router(
+    PersistedQueryRouter(schema=public_schema, context_getter=get_public_context),
+    prefix="/publicgraphql",
 )
-public_schema = strawberry.Schema(query=PublicQuery)
-app.include_router(GraphQLRouter(schema=authenticated_schema), prefix="/graphql")
-app.include_router(GraphQLRouter(schema=public_schema), prefix="/publicgraphql")
+
+def token_verifier_stats():
+    if _token_verifier is None:
+        return {}
+    # hits and misses of the token -> user id cache, next to how misses were verified
+    return {
+        **_token_verifier.stats,
+        "hits": _token_verifier.tokens.hits,
+        "misses": _token_verifier.tokens.misses,
+        "entries": len(_token_verifier.tokens),
+    }
+
+
+if METRICS_ENABLED:
+    # added last so it is the outermost middleware and its total covers the rest
+    app.middleware("http")(record_request)
+    app.add_route("/metrics", metrics_endpoint)
+    register_stats("token_verifier", token_verifier_stats)
+    register_stats("slug_cache", lambda: slug_cache.stats)
+    register_stats("render_cache", lambda: render_cache.stats)
+    register_stats("documents", lambda: lru_stats(documents))
+    register_stats("templates", lambda: lru_stats(templates))
+    register_stats("fonts", lambda: fonts.stats)
+    register_stats("render_workers", lambda: render_workers.stats)
+    register_stats(
+        "orphan_cleaner",
+        lambda: {
+            **orphan_cleaner.stats,
+            "pending": sum(map(len, orphan_cleaner.pending.values())),
+        },
+    )
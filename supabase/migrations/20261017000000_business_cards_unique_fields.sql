@@ -0,0 +1,6 @@
+-- create_business_card writes each card with a single upsert and relies on this
+-- constraint (on_conflict) to reject a user's duplicate cards.
+-- Existing duplicate rows have to be removed before it can be applied.
+alter table public.business_cards
+  add constraint business_cards_unique_fields
+  unique (user_id, email, job_title, full_name, phone_number, website, base_card);
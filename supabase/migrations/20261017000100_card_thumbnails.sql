@@ -0,0 +1,4 @@
+-- Thumbnail variants stored next to the full size images. Rows created before
+-- this have no thumbnail and keep null here.
+alter table public.business_cards add column thumbnail_url text;
+alter table public.digital_cards add column qr_code_thumbnail text;
@@ -0,0 +1,6 @@
+-- Whether a card's image has been rendered. With RENDER_MODE=queue rows are
+-- written PENDING and the render worker sets READY or FAILED; inline renders
+-- and existing rows are READY.
+alter table public.business_cards
+  add column image_status text not null default 'READY'
+  check (image_status in ('PENDING', 'READY', 'FAILED'));
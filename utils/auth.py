@@ -0,0 +1,103 @@
+import hashlib
+import os
+import time
+import httpx
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+from utils.lru import LRUCache
+
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL")
+# ask GoTrue when a token can't be verified locally
+AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "true").lower() == "true"
+# upper bound on how long a verified token is trusted, so sign-outs still apply
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+JWKS_CACHE_TTL = float(os.getenv("JWKS_CACHE_TTL", "600"))
+AUDIENCE = "authenticated"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class TokenVerifier:
+    def __init__(
+        self,
+        auth_client,
+        jwt_secret=None,
+        jwks_url=None,
+        remote_fallback=True,
+        ttl=AUTH_CACHE_TTL,
+        max_entries=AUTH_CACHE_SIZE,
+        transport=None,
+    ):
+        self.auth_client = auth_client
+        self.jwt_secret = jwt_secret
+        self.jwks_url = jwks_url
+        self.remote_fallback = remote_fallback
+        self.ttl = ttl
+        self.tokens = LRUCache(max_entries=max_entries)
+        self.stats = {"local": 0, "remote": 0, "rejected": 0}
+        self._http_client = httpx.AsyncClient(transport=transport)
+        self._jwks = None
+        self._jwks_fetched_at = None
+
+    async def user_id(self, token):
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        cached = self.tokens.get(key)
+        if cached is not None:
+            user_id, expires_at = cached
+            if now < expires_at:
+                return user_id
+            self.tokens.pop(key)
+
+        try:
+            user_id, exp = await self._verify(token)
+        except InvalidToken:
+            self.stats["rejected"] += 1
+            raise
+        self.tokens.set(key, (user_id, min(exp, now + self.ttl)))
+        return user_id
+
+    async def _verify(self, token):
+        if self.jwt_secret or self.jwks_url:
+            try:
+                return await self._verify_locally(token)
+            except ExpiredSignatureError as e:
+                raise InvalidToken("Token has expired") from e
+            except (JWTError, httpx.HTTPError) as e:
+                if not self.remote_fallback:
+                    raise InvalidToken(str(e)) from e
+        return await self._verify_remotely(token)
+
+    async def _verify_locally(self, token):
+        if self.jwt_secret:
+            key, algorithms = self.jwt_secret, ["HS256"]
+        else:
+            key, algorithms = await self._get_jwks(), ["RS256", "ES256"]
+        claims = jwt.decode(token, key, algorithms=algorithms, audience=AUDIENCE)
+        self.stats["local"] += 1
+        return claims["sub"], claims["exp"]
+
+    async def _verify_remotely(self, token):
+        try:
+            auth = await self.auth_client.get_user(token)
+        except Exception as e:
+            raise InvalidToken(str(e)) from e
+        self.stats["remote"] += 1
+        try:
+            exp = jwt.get_unverified_claims(token)["exp"]
+        except (JWTError, KeyError):
+            exp = time.time() + self.ttl
+        return auth.user.id, exp
+
+    async def _get_jwks(self):
+        now = time.monotonic()
+        if self._jwks is None or now - self._jwks_fetched_at > JWKS_CACHE_TTL:
+            response = await self._http_client.get(self.jwks_url)
+            response.raise_for_status()
+            self._jwks = response.json()
+            self._jwks_fetched_at = now
+        return self._jwks
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import time
+from utils.lru import LRUCache
+
+CARD_CACHE_TTL = float(os.getenv("CARD_CACHE_TTL", "60"))
+# unknown slugs are remembered for less time so a new card shows up quickly
+CARD_CACHE_NEGATIVE_TTL = float(os.getenv("CARD_CACHE_NEGATIVE_TTL", "10"))
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "10000"))
+# redis://... shares the cache (and its invalidations) between instances,
+# memory:// is an in-process stand-in that serializes like a shared store
+CARD_CACHE_URL = os.getenv("CARD_CACHE_URL")
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=CARD_CACHE_SIZE, serialize=False):
+        self.entries = LRUCache(max_entries=max_entries)
+        self.serialize = serialize
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self.entries.pop(key)
+            return None
+        return json.loads(value) if self.serialize else value
+
+    async def set(self, key, value, ttl):
+        if self.serialize:
+            value = json.dumps(value)
+        self.entries.set(key, (value, time.monotonic() + ttl))
+
+    async def delete(self, key):
+        self.entries.pop(key)
+
+
+class RedisBackend:
+    def __init__(self, url, prefix="cards:"):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "CARD_CACHE_URL=redis://... needs the redis package installed"
+            ) from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key):
+        value = await self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key, value, ttl):
+        await self.client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, key):
+        await self.client.delete(self.prefix + key)
+
+
+def create_backend(url=CARD_CACHE_URL):
+    if not url:
+        return MemoryBackend()
+    if url == "memory://":
+        return MemoryBackend(serialize=True)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CARD_CACHE_URL {url}")
+
+
+class ReadThroughCache:
+    def __init__(
+        self, backend, ttl=CARD_CACHE_TTL, negative_ttl=CARD_CACHE_NEGATIVE_TTL
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+        self._loading = {}
+        self._tokens = {}
+
+    async def get(self, key, load):
+        # returns the cached value, or load()'s result which may be None for missing
+        entry = await self.backend.get(key)
+        if entry is not None:
+            found = entry["value"] is not None
+            self.stats["hits" if found else "negative_hits"] += 1
+            return entry["value"]
+
+        self.stats["misses"] += 1
+        # concurrent lookups of the same key share one load
+        loading = self._loading.get(key)
+        if loading is None:
+            token = object()
+            self._tokens[key] = token
+            loading = asyncio.ensure_future(self._load(key, load, token))
+            self._loading[key] = loading
+        return await asyncio.shield(loading)
+
+    async def _load(self, key, load, token):
+        try:
+            value = await load()
+            # skip the write if the key was invalidated while loading
+            if self._tokens.get(key) is token:
+                await self.backend.set(key, {"value": value}, self.max_age(value))
+            return value
+        finally:
+            if self._tokens.get(key) is token:
+                del self._tokens[key]
+                del self._loading[key]
+
+    def max_age(self, value):
+        return self.ttl if value is not None else self.negative_ttl
+
+    async def invalidate(self, key):
+        self._tokens.pop(key, None)
+        self._loading.pop(key, None)
+        await self.backend.delete(key)
+
+
+slug_cache = ReadThroughCache(create_backend())
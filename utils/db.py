@@ -0,0 +1,159 @@
+import os
+import time
+import httpx
+from gotrue import AsyncGoTrueClient
+from postgrest import AsyncPostgrestClient, AsyncRequestBuilder
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from storage3 import AsyncStorageClient
+from utils.metrics import METRICS_ENABLED, observe_remote_call
+
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+
+def remote_call_name(request):
+    # e.g. postgrest.get, storage.upload, auth.user
+    parts = request.url.path.split("/")
+    service = parts[1] if len(parts) > 1 else ""
+    if service == "rest":
+        return f"postgrest.{request.method.lower()}"
+    if service == "storage":
+        action = parts[4] if len(parts) > 4 else ""
+        if action in ("list", "copy", "move", "sign", "public"):
+            return f"storage.{action}"
+        return {"GET": "storage.download", "DELETE": "storage.remove"}.get(
+            request.method, "storage.upload"
+        )
+    if service == "auth":
+        return f"auth.{parts[-1]}"
+    return "other"
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    # times every call made through the shared pool, see utils/metrics.py
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        start = time.perf_counter()
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            observe_remote_call(remote_call_name(request), time.perf_counter() - start)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class PostgrestClient(AsyncPostgrestClient):
+    def __init__(self, base_url, transport, **kwargs):
+        self.transport = transport
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=self.transport,
+        )
+
+
+class StorageClient(AsyncStorageClient):
+    def __init__(self, url, headers, transport, timeout):
+        self.transport = transport
+        super().__init__(url, headers, timeout)
+
+    def _create_session(self, base_url, headers, timeout):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=self.transport,
+        )
+
+
+class ScopedSession:
+    # adds per-request headers on top of a shared PostgREST session without
+    # touching its defaults, so concurrent users never see each other's token
+    def __init__(self, session, headers):
+        self.session = session
+        self._headers = headers
+
+    @property
+    def base_url(self):
+        return self.session.base_url
+
+    @property
+    def headers(self):
+        headers = self.session.headers.copy()
+        headers.update(self._headers)
+        return headers
+
+    async def request(self, method, url, headers=None, **kwargs):
+        merged = httpx.Headers(self._headers)
+        if headers:
+            merged.update(headers)
+        return await self.session.request(method, url, headers=merged, **kwargs)
+
+
+class ScopedSupabase:
+    # PostgREST calls run as the signed in user (so RLS applies), storage keeps
+    # using the project key like before
+    def __init__(self, supabase, token):
+        self.supabase = supabase
+        self.storage = supabase.storage
+        self.session = ScopedSession(
+            supabase.postgrest.session, {"Authorization": f"Bearer {token}"}
+        )
+
+    def table(self, table_name):
+        return AsyncRequestBuilder(self.session, f"/{table_name}")
+
+
+class AsyncSupabase:
+    # PostgREST, storage and auth share one keep-alive connection pool
+    def __init__(self, supabase_url, supabase_key):
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        headers = {"apiKey": supabase_key, "Authorization": f"Bearer {supabase_key}"}
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+            )
+        )
+        if METRICS_ENABLED:
+            self.transport = InstrumentedTransport(self.transport)
+        self.postgrest = PostgrestClient(
+            f"{supabase_url}/rest/v1",
+            self.transport,
+            headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, **headers},
+            timeout=SUPABASE_TIMEOUT,
+        )
+        self.storage = StorageClient(
+            f"{supabase_url}/storage/v1", headers, self.transport, SUPABASE_TIMEOUT
+        )
+        self.auth = AsyncGoTrueClient(
+            url=f"{supabase_url}/auth/v1",
+            headers=headers,
+            auto_refresh_token=False,
+            persist_session=False,
+            http_client=httpx.AsyncClient(
+                timeout=SUPABASE_TIMEOUT, transport=self.transport
+            ),
+        )
+
+    def table(self, table_name):
+        return self.postgrest.from_(table_name)
+
+    def scoped(self, token):
+        return ScopedSupabase(self, token)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def create_client(supabase_url, supabase_key):
+    return AsyncSupabase(supabase_url, supabase_key)
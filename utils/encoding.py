@@ -0,0 +1,50 @@
+import io
+import os
+
+# png or webp (lossless) for rendered cards, QR codes are always PNG
+CARD_IMAGE_FORMAT = os.getenv("CARD_IMAGE_FORMAT", "png").lower()
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "6"))
+PNG_OPTIMIZE = os.getenv("PNG_OPTIMIZE", "false").lower() == "true"
+# 0 encodes about as fast as PNG, higher methods trade a lot of time for a few %
+WEBP_METHOD = int(os.getenv("WEBP_METHOD", "0"))
+CARD_THUMBNAIL_WIDTH = int(os.getenv("CARD_THUMBNAIL_WIDTH", "320"))
+QR_THUMBNAIL_SIZE = int(os.getenv("QR_THUMBNAIL_SIZE", "120"))
+
+VARIANTS = ("full", "thumbnail")
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+def encoding_settings():
+    # anything that changes the encoded bytes, for cache keys
+    return [
+        CARD_IMAGE_FORMAT,
+        PNG_COMPRESS_LEVEL,
+        PNG_OPTIMIZE,
+        WEBP_METHOD,
+        CARD_THUMBNAIL_WIDTH,
+    ]
+
+
+def encode_image(image, image_format=CARD_IMAGE_FORMAT):
+    img_io = io.BytesIO()
+    if image_format == "webp":
+        image.save(img_io, "WEBP", lossless=True, method=WEBP_METHOD)
+    else:
+        image.save(
+            img_io, "PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=PNG_OPTIMIZE
+        )
+    return img_io.getvalue()
+
+
+def thumbnail(image, width=CARD_THUMBNAIL_WIDTH):
+    from PIL import Image
+
+    if image.width <= width:
+        return image
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def variant_path(stem, variant, image_format=CARD_IMAGE_FORMAT):
+    suffix = "" if variant == "full" else f"-{variant}"
+    return f"{stem}{suffix}.{image_format}"
@@ -0,0 +1,61 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+from utils.fonts import preload_fonts
+from utils.layout import compile_layouts
+
+# "thread", "process" or "inline" (render on the event loop like before)
+RENDER_EXECUTOR = os.getenv("RENDER_EXECUTOR", "thread")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor = None
+
+
+def warm_worker():
+    preload_fonts()
+    compile_layouts()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if RENDER_EXECUTOR == "process":
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS, initializer=warm_worker
+            )
+        else:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=RENDER_WORKERS, thread_name_prefix="render"
+            )
+    return _executor
+
+
+def start_executor():
+    if RENDER_EXECUTOR == "inline":
+        return
+    executor = get_executor()
+    # make every worker process start (and warm up) before the first request
+    if RENDER_EXECUTOR == "process":
+        concurrent.futures.wait(
+            [executor.submit(warm_worker) for _ in range(RENDER_WORKERS)]
+        )
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def run_render(func, *args):
+    if RENDER_EXECUTOR == "inline":
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args)
+    if RENDER_EXECUTOR != "process":
+        # threads see the calling request's context, e.g. its metrics
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(get_executor(), call)
@@ -0,0 +1,38 @@
+CONTEXT_LIGHT = "./utils/ContextLight.ttf"
+ARIAL_BLACK = "./utils/ARIBL0.ttf"
+
+# the card layouts font ladder (52/42/32/28) with each per-field addition applied
+BASE_SIZES = (52, 42, 32, 28)
+ADDITIONS = (4, 0, -4, -6)
+PRELOAD = {
+    CONTEXT_LIGHT: sorted(
+        {size + addition for size in BASE_SIZES for addition in ADDITIONS}
+    ),
+    ARIAL_BLACK: [15],
+}
+
+_fonts = {}
+stats = {"hits": 0, "misses": 0}
+
+
+def get_font(path, size):
+    from PIL import ImageFont
+
+    key = (path, size)
+    font = _fonts.get(key)
+    if font is None:
+        stats["misses"] += 1
+        font = ImageFont.truetype(path, size)
+        _fonts[key] = font
+    else:
+        stats["hits"] += 1
+    return font
+
+
+def preload_fonts():
+    from PIL import ImageFont
+
+    for path, sizes in PRELOAD.items():
+        for size in sizes:
+            if (path, size) not in _fonts:
+                _fonts[(path, size)] = ImageFont.truetype(path, size)
@@ -0,0 +1,49 @@
+import hashlib
+import re
+from starlette.responses import Response
+
+MAX_AGE = re.compile(r"(?<![-\w])max-age=(\d+)")
+STALE_WHILE_REVALIDATE = re.compile(r"stale-while-revalidate=(\d+)")
+
+
+def cache_for(info, max_age, stale_while_revalidate=0):
+    # a response is only as fresh as its shortest lived field
+    response = info.context["response"]
+    current = response.headers.get("Cache-Control")
+    if current is not None:
+        current_max_age = MAX_AGE.search(current)
+        current_stale = STALE_WHILE_REVALIDATE.search(current)
+        max_age = min(max_age, int(current_max_age.group(1)))
+        stale_while_revalidate = min(
+            stale_while_revalidate,
+            int(current_stale.group(1)) if current_stale else 0,
+        )
+    value = f"public, max-age={int(max_age)}"
+    if int(stale_while_revalidate):
+        value += f", stale-while-revalidate={int(stale_while_revalidate)}"
+    response.headers["Cache-Control"] = value
+
+
+async def conditional_response(request, response):
+    # adds an ETag to cacheable responses and answers 304 when the client has it
+    if response.status_code != 200 or "cache-control" not in response.headers:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    # raw headers keep repeated ones, like several Vary or Set-Cookie lines
+    headers = [
+        (name, value)
+        for name, value in response.raw_headers
+        if name not in (b"content-length", b"etag")
+    ]
+    headers.append((b"etag", etag.encode()))
+    if etag in request.headers.get("if-none-match", ""):
+        # everything a 200 would carry (CORS, Vary, ...) except the body's own
+        not_modified = Response(status_code=304)
+        not_modified.raw_headers = [
+            (name, value) for name, value in headers if name != b"content-type"
+        ]
+        return not_modified
+    fresh = Response(content=body, status_code=200)
+    fresh.raw_headers = [*headers, (b"content-length", str(len(body)).encode())]
+    return fresh
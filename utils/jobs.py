@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# memory:// keeps jobs in the process, sqlite:///path/to/jobs.db survives restarts
+RENDER_QUEUE_URL = os.getenv("RENDER_QUEUE_URL", "memory://")
+RENDER_QUEUE_WORKERS = int(os.getenv("RENDER_QUEUE_WORKERS", "2"))
+RENDER_JOB_ATTEMPTS = int(os.getenv("RENDER_JOB_ATTEMPTS", "3"))
+# seconds before the first retry, doubled after every further failure
+RENDER_JOB_BACKOFF = float(os.getenv("RENDER_JOB_BACKOFF", "1"))
+# how often idle workers look for jobs queued by other processes
+RENDER_QUEUE_POLL = float(os.getenv("RENDER_QUEUE_POLL", "1"))
+
+
+class MemoryQueue:
+    # jobs are keyed by what they write, so a job put again while it is queued
+    # or running is coalesced instead of racing the earlier one
+    def __init__(self):
+        self.jobs = {}
+        self._wakeup = asyncio.Event()
+
+    async def put(self, job_id, content_hash, payload):
+        # returns False when an identical job is already queued or running
+        job = self.jobs.get(job_id)
+        if job is not None and job["status"] in ("pending", "running"):
+            if job["hash"] == content_hash:
+                return False
+            # a running job goes back to pending with this payload when it ends
+            job.update(hash=content_hash, payload=payload, attempts=0, error=None)
+        else:
+            self.jobs[job_id] = {
+                "id": job_id,
+                "hash": content_hash,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "error": None,
+                "run_at": time.time(),
+            }
+        self._wakeup.set()
+        return True
+
+    async def claim(self):
+        now = time.time()
+        ready = [
+            job
+            for job in self.jobs.values()
+            if job["status"] == "pending" and job["run_at"] <= now
+        ]
+        if not ready:
+            return None
+        job = min(ready, key=lambda job: job["run_at"])
+        job["status"] = "running"
+        job["attempts"] += 1
+        return dict(job)
+
+    async def finish(self, job, error=None, retry_at=None):
+        # returns the job's new status, or None if it changed or was cancelled
+        current = self.jobs.get(job["id"])
+        if current is None:
+            return None
+        if current["hash"] != job["hash"]:
+            current.update(status="pending", run_at=time.time())
+            self._wakeup.set()
+            return None
+        if error is None:
+            del self.jobs[job["id"]]
+            return "done"
+        if retry_at is not None:
+            current.update(status="pending", error=error, run_at=retry_at)
+            return "pending"
+        current.update(status="failed", error=error)
+        return "failed"
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def cancel(self, job_id):
+        self.jobs.pop(job_id, None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+
+class SQLiteQueue(MemoryQueue):
+    def __init__(self, path):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                run_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+            """
+        )
+        # jobs this queue was running when the process stopped
+        self.db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(*args)
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            return result
+
+    def _row(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def _put(self, job_id, content_hash, payload):
+        job = self._row(job_id)
+        if job is not None and job["status"] in ("pending", "running"):
+            if job["hash"] == content_hash:
+                return False
+            self.db.execute(
+                "UPDATE jobs SET hash = ?, payload = ?, attempts = 0, error = NULL"
+                " WHERE id = ?",
+                (content_hash, json.dumps(payload), job_id),
+            )
+        else:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs (id, hash, payload, status, run_at)"
+                " VALUES (?, ?, ?, 'pending', ?)",
+                (job_id, content_hash, json.dumps(payload), time.time()),
+            )
+        return True
+
+    async def put(self, job_id, content_hash, payload):
+        queued = await asyncio.to_thread(
+            self._transaction, self._put, job_id, content_hash, payload
+        )
+        if queued:
+            self._wakeup.set()
+        return queued
+
+    def _claim(self):
+        row = self.db.execute(
+            "SELECT id FROM jobs WHERE status = 'pending' AND run_at <= ?"
+            " ORDER BY run_at LIMIT 1",
+            (time.time(),),
+        ).fetchone()
+        if row is None:
+            return None
+        self.db.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1"
+            " WHERE id = ?",
+            (row["id"],),
+        )
+        return self._row(row["id"])
+
+    async def claim(self):
+        return await asyncio.to_thread(self._transaction, self._claim)
+
+    def _finish(self, job, error, retry_at):
+        current = self._row(job["id"])
+        if current is None:
+            return None
+        if current["hash"] != job["hash"]:
+            self.db.execute(
+                "UPDATE jobs SET status = 'pending', run_at = ? WHERE id = ?",
+                (time.time(), job["id"]),
+            )
+            return None
+        if error is None:
+            self.db.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+            return "done"
+        status = "pending" if retry_at is not None else "failed"
+        self.db.execute(
+            "UPDATE jobs SET status = ?, error = ?, run_at = ? WHERE id = ?",
+            (status, error, retry_at or current["run_at"], job["id"]),
+        )
+        return status
+
+    async def finish(self, job, error=None, retry_at=None):
+        status = await asyncio.to_thread(
+            self._transaction, self._finish, job, error, retry_at
+        )
+        if status is None:
+            self._wakeup.set()
+        return status
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self._transaction, self._row, job_id)
+
+    async def cancel(self, job_id):
+        await asyncio.to_thread(
+            self._transaction,
+            self.db.execute,
+            "DELETE FROM jobs WHERE id = ?",
+            (job_id,),
+        )
+
+
+def create_queue(url=RENDER_QUEUE_URL):
+    if not url or url == "memory://":
+        return MemoryQueue()
+    if url.startswith("sqlite:///"):
+        return SQLiteQueue(url[len("sqlite:///") :])
+    raise ValueError(f"Unsupported RENDER_QUEUE_URL {url}")
+
+
+class JobWorkers:
+    def __init__(
+        self,
+        queue,
+        handler,
+        on_done=None,
+        on_failed=None,
+        workers=RENDER_QUEUE_WORKERS,
+        max_attempts=RENDER_JOB_ATTEMPTS,
+        backoff=RENDER_JOB_BACKOFF,
+        poll_interval=RENDER_QUEUE_POLL,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.on_done = on_done
+        self.on_failed = on_failed
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.stats = {"done": 0, "retried": 0, "failed": 0}
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            job = await self.queue.claim()
+            if job is None:
+                await self.queue.wait(self.poll_interval)
+                continue
+            try:
+                await self._process(job)
+            except Exception:
+                # a failing status callback must not stop the worker
+                logging.getLogger(__name__).exception(
+                    "Render job %s callback failed", job["id"]
+                )
+
+    async def _process(self, job):
+        try:
+            await self.handler(job["payload"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] < self.max_attempts:
+                retry_at = time.time() + self.backoff * 2 ** (job["attempts"] - 1)
+                if await self.queue.finish(job, error, retry_at) == "pending":
+                    self.stats["retried"] += 1
+            elif await self.queue.finish(job, error) == "failed":
+                self.stats["failed"] += 1
+                if self.on_failed is not None:
+                    await self.on_failed(job["payload"])
+            return
+        if await self.queue.finish(job) == "done":
+            self.stats["done"] += 1
+            if self.on_done is not None:
+                await self.on_done(job["payload"])
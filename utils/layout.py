@@ -0,0 +1,185 @@
+import json
+import os
+import string
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from utils.fonts import get_font
+
+FONT_DIR = "./utils"
+LAYOUT_DIR = os.getenv("CARD_LAYOUT_DIR", "./utils/card_layouts")
+
+
+@dataclass
+class TextField:
+    name: str
+    x: int
+    y: int
+    text: Optional[str] = None
+    align: str = "left"
+    addition: int = 0
+    baseline_offset: bool = False
+    fill: str = "black"
+
+
+@dataclass
+class QRSlot:
+    field: str
+    right: int
+    top: int
+    size: int
+    border: int = 2
+    box_size: int = 10
+    fill_color: str = "black"
+    back_color: str = "white"
+
+
+@dataclass
+class Clear:
+    color: str
+    left: int
+    right: int
+
+
+@dataclass
+class Layout:
+    template: str
+    fields: List[TextField]
+    font: str
+    version: int = 1
+    font_size: Optional[int] = None
+    # (max characters, font size) steps, a max of None matches anything longer
+    font_ladder: List[Tuple[Optional[int], int]] = field(default_factory=list)
+    qr: Optional[QRSlot] = None
+    clear: Optional[Clear] = None
+
+    @classmethod
+    def from_dict(cls, spec):
+        spec = dict(spec)
+        spec["fields"] = [TextField(**f) for f in spec["fields"]]
+        spec["font_ladder"] = [tuple(step) for step in spec.get("font_ladder", [])]
+        if spec.get("qr"):
+            spec["qr"] = QRSlot(**spec["qr"])
+        if spec.get("clear"):
+            spec["clear"] = Clear(**spec["clear"])
+        return cls(**spec)
+
+
+def baseline_offset(font_size):
+    # smaller fonts sit lower so their text lines up with the card icons
+    return 7 if font_size >= 32 else 10
+
+
+class CompiledField:
+    def __init__(self, layout, text_field):
+        self.name = text_field.name
+        self.text = text_field.text
+        self.fill = text_field.fill
+        self.centered = text_field.align == "center"
+        self.x = text_field.x
+        font_path = os.path.join(FONT_DIR, layout.font)
+        if layout.font_size is not None:
+            ladder = [(None, layout.font_size)]
+        else:
+            ladder = layout.font_ladder
+        # resolve the font and y position for each step of the ladder up front
+        self.steps = []
+        for max_length, size in ladder:
+            size += text_field.addition
+            y = text_field.y
+            if text_field.baseline_offset:
+                y += baseline_offset(size)
+            self.steps.append((max_length, get_font(font_path, size), y))
+
+    def pick(self, value):
+        length = len(value)
+        for max_length, font, y in self.steps:
+            if max_length is None or length <= max_length:
+                return font, y
+        return self.steps[-1][1:]
+
+    def draw(self, draw, width, values):
+        value = values[self.name]
+        font, y = self.pick(value)
+        text = self.text.format(**values) if self.text else value
+        x = self.x
+        if self.centered:
+            # the ink's width, like textsize, so a negative left bearing counts
+            left, _, right, _ = font.getbbox(text)
+            x += (width - (right - left)) / 2
+        draw.text((x, y), text, fill=self.fill, font=font)
+
+
+class CompiledLayout:
+    def __init__(self, layout):
+        self.layout = layout
+        self.template = layout.template
+        self.version = layout.version
+        self.qr = layout.qr
+        self.clear = layout.clear
+        self.fields = [CompiledField(layout, f) for f in layout.fields]
+        # card values that show up on the image, other values never need a re-render
+        self.visible_fields = {f.name for f in layout.fields}
+        for text_field in layout.fields:
+            if text_field.text:
+                self.visible_fields.update(
+                    name
+                    for _, name, _, _ in string.Formatter().parse(text_field.text)
+                    if name
+                )
+        if self.qr:
+            self.visible_fields.add(self.qr.field)
+
+    def render(self, image, values):
+        # Pillow and the QR code stack are only imported once something renders
+        from PIL import ImageDraw
+        from utils.qr import generate_qr_code
+
+        width, height = image.size
+        draw = ImageDraw.Draw(image)
+        if self.clear:
+            draw.rectangle([(0, 0), (self.clear.left, height)], fill=self.clear.color)
+            draw.rectangle(
+                [(width - self.clear.right, 0), (width, height)], fill=self.clear.color
+            )
+        for compiled_field in self.fields:
+            compiled_field.draw(draw, width, values)
+        if self.qr:
+            qr_code = generate_qr_code(
+                values[self.qr.field],
+                box_size=self.qr.box_size,
+                border=self.qr.border,
+                fill_color=self.qr.fill_color,
+                back_color=self.qr.back_color,
+                image_size=(self.qr.size, self.qr.size),
+            )
+            image.paste(qr_code, (width - qr_code.width - self.qr.right, self.qr.top))
+        return image
+
+
+def load_layouts(directory=LAYOUT_DIR):
+    layouts = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename)) as f:
+                layout = Layout.from_dict(json.load(f))
+            layouts[layout.template] = layout
+    return layouts
+
+
+layouts: Dict[str, Layout] = load_layouts()
+_compiled: Dict[str, CompiledLayout] = {}
+
+
+def get_layout(base_card):
+    compiled = _compiled.get(base_card)
+    if compiled is None:
+        if base_card not in layouts:
+            raise ValueError(f"No card layout for base card {base_card}")
+        compiled = CompiledLayout(layouts[base_card])
+        _compiled[base_card] = compiled
+    return compiled
+
+
+def compile_layouts():
+    for base_card in layouts:
+        get_layout(base_card)
@@ -0,0 +1,128 @@
+import asyncio
+from strawberry.dataloader import DataLoader
+from strawberry.types.nodes import SelectedField, convert_selections
+
+ALL_COLUMNS = "*"
+
+
+def rows_loader(db, table, column, many=False):
+    # keys are (value, columns) pairs, batched into one in_() query per column list
+    async def load(keys):
+        values_by_columns = {}
+        for value, columns in keys:
+            values_by_columns.setdefault(columns, set()).add(value)
+
+        async def select(columns, values):
+            projection = columns
+            if columns != ALL_COLUMNS and column not in columns.split(","):
+                projection = f"{columns},{column}"
+            result = await (
+                db.table(table).select(projection).in_(column, list(values)).execute()
+            )
+            return columns, result.data
+
+        found = {}
+        for columns, rows in await asyncio.gather(
+            *(select(*item) for item in values_by_columns.items())
+        ):
+            for row in rows:
+                key = (row[column], columns)
+                if many:
+                    found.setdefault(key, []).append(row)
+                else:
+                    found[key] = row
+        return [found.get(key, [] if many else None) for key in keys]
+
+    return DataLoader(load_fn=load)
+
+
+def create_loaders(db):
+    # one set per request, so rows are never shared between users
+    return {
+        "business_card": rows_loader(db, "business_cards", "id"),
+        "business_cards_by_user": rows_loader(
+            db, "business_cards", "user_id", many=True
+        ),
+        "digital_card": rows_loader(db, "digital_cards", "id"),
+        "digital_cards_by_user": rows_loader(db, "digital_cards", "user_id", many=True),
+        "digital_card_by_slug": rows_loader(db, "digital_cards", "slug"),
+    }
+
+
+def _selected_fields(selections, type_name=None):
+    # the fields in a selection set, looking through fragments on type_name
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        elif type_name is None or selection.type_condition in (None, type_name):
+            yield from _selected_fields(selection.selections, type_name)
+
+
+def _nested_selections(info, path):
+    selections = info.selected_fields[0].selections
+    for name in path:
+        selections = [
+            nested
+            for field in _selected_fields(selections)
+            if field.name == name
+            for nested in field.selections
+        ]
+    return selections
+
+
+def is_selected(info, name):
+    return any(field.name == name for field in _nested_selections(info, ()))
+
+
+def selected_columns(info, type_, required=("id",), path=()):
+    # the columns behind the fields of type_ this field's selection set asks
+    # for, path leads through wrappers such as ("edges", "node")
+    name_converter = info.schema.config.name_converter
+    definition = type_._type_definition
+    columns = {
+        name_converter.get_graphql_name(field): field.python_name
+        for field in definition.fields
+    }
+    fields = _selected_fields(
+        _nested_selections(info, path), name_converter.from_object(definition)
+    )
+    selected = {columns[field.name] for field in fields if field.name in columns}
+    return ",".join(sorted(selected.union(required)))
+
+
+def from_row(type_, row):
+    # fields whose columns were not selected are never resolved
+    fields = dict.fromkeys(field.python_name for field in type_._type_definition.fields)
+    return type_(**{**fields, **row})
+
+
+def operation_ids(info, field_names):
+    # ids passed to the given root fields anywhere in the current operation
+    raw_info = info._raw_info
+    selections = convert_selections(
+        raw_info, raw_info.operation.selection_set.selections
+    )
+    ids = set()
+    while selections:
+        selection = selections.pop()
+        if not isinstance(selection, SelectedField):
+            selections.extend(selection.selections)
+        elif selection.name in field_names:
+            try:
+                ids.add(int(selection.arguments.get("id")))
+            except (TypeError, ValueError):
+                continue
+    return ids
+
+
+async def load_for_mutation(info, loader_name, field_names, id):
+    # mutations run one after another, so the first one fetches the rows for all
+    loader = info.context["loaders"][loader_name]
+    ids = [id, *(operation_ids(info, field_names) - {id})]
+    rows = await loader.load_many([(card_id, ALL_COLUMNS) for card_id in ids])
+    return rows[0]
+
+
+def remember_row(info, loader_name, id, row):
+    # call after writing a row (None once deleted) so later mutations see the change
+    info.context["loaders"][loader_name].prime((id, ALL_COLUMNS), row, force=True)
@@ -0,0 +1,251 @@
+import bisect
+import contextlib
+import contextvars
+import inspect
+import os
+import threading
+import time
+from strawberry.extensions import SchemaExtension
+from starlette.responses import PlainTextResponse, Response
+
+# off by default, when off nothing below is hooked into the app
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# bearer token /metrics asks for when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+_lock = threading.Lock()
+# phase durations and remote call counts of the request being handled
+_request = contextvars.ContextVar("request_metrics", default=None)
+
+
+class Histogram:
+    def __init__(self, name, help, label_names, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [per bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+
+    def observe(self, labels, value):
+        with _lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.series[labels] = series
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = sorted(
+                (labels, (list(counts), total, count))
+                for labels, (counts, total, count) in self.series.items()
+            )
+        for labels, (counts, total, count) in series:
+            label_text = ",".join(
+                f'{name}="{value}"' for name, value in zip(self.label_names, labels)
+            )
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+http_requests = Histogram(
+    "http_request_duration_seconds", "Time to the response headers.", ("path",)
+)
+resolvers = Histogram(
+    "graphql_resolver_duration_seconds", "Root field resolvers.", ("field",)
+)
+phases = Histogram(
+    "phase_duration_seconds", "Auth, GraphQL and render phases.", ("phase",)
+)
+remote_calls = Histogram(
+    "remote_call_duration_seconds", "Calls to PostgREST, Storage and Auth.", ("call",)
+)
+calls_per_request = Histogram(
+    "remote_calls_per_request",
+    "Remote calls one request made.",
+    ("call",),
+    buckets=COUNT_BUCKETS,
+)
+HISTOGRAMS = (http_requests, resolvers, phases, remote_calls, calls_per_request)
+
+# source -> function returning a dict of counters, read on every scrape
+_stats = {}
+
+
+def register_stats(source, get_stats):
+    _stats[source] = get_stats
+
+
+def lru_stats(cache):
+    return {
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "entries": len(cache),
+        "bytes": cache.size_bytes,
+    }
+
+
+def _add_to_request(key, name, value):
+    state = _request.get()
+    if state is not None:
+        with _lock:
+            state[key][name] = state[key].get(name, 0) + value
+
+
+def observe_phase(name, seconds):
+    phases.observe((name,), seconds)
+    _add_to_request("phases", name, seconds)
+
+
+def observe_remote_call(call, seconds):
+    remote_calls.observe((call,), seconds)
+    _add_to_request("phases", call, seconds)
+    _add_to_request("calls", call, 1)
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        observe_phase(self.name, time.perf_counter() - self.start)
+
+
+_NOT_MEASURED = contextlib.nullcontext()
+
+
+def phase(name):
+    # with phase("draw"): ... records how long the block took
+    if not METRICS_ENABLED:
+        return _NOT_MEASURED
+    return _Phase(name)
+
+
+class MetricsExtension(SchemaExtension):
+    # times parsing, validation, execution and every root field resolver
+    def on_parse(self):
+        with _Phase("graphql.parse"):
+            yield
+
+    def on_validate(self):
+        with _Phase("graphql.validate"):
+            yield
+
+    def on_execute(self):
+        with _Phase("graphql.execute"):
+            yield
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        if info.path.prev is not None:
+            return _next(root, info, *args, **kwargs)
+        field = f"{info.parent_type.name}.{info.field_name}"
+        start = time.perf_counter()
+        result = _next(root, info, *args, **kwargs)
+        if inspect.isawaitable(result):
+            return self._finish(result, field, start)
+        resolvers.observe((field,), time.perf_counter() - start)
+        return result
+
+    async def _finish(self, result, field, start):
+        try:
+            return await result
+        finally:
+            resolvers.observe((field,), time.perf_counter() - start)
+
+
+def server_timing(state, total):
+    entries = []
+    for name, seconds in state["phases"].items():
+        entry = f"{name};dur={seconds * 1000:.1f}"
+        calls = state["calls"].get(name)
+        if calls is not None:
+            entry += f';desc="calls={calls}"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+async def record_request(request, call_next):
+    # outermost middleware: collects this request's phases for Server-Timing
+    state = {"phases": {}, "calls": {}}
+    reset_token = _request.set(state)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request.reset(reset_token)
+    total = time.perf_counter() - start
+    # only the app's own paths become labels, anything else is "other"
+    path = request.url.path
+    if path not in {getattr(route, "path", None) for route in request.app.routes}:
+        path = "other"
+    http_requests.observe((path,), total)
+    for call, count in state["calls"].items():
+        calls_per_request.observe((call,), count)
+    response.headers["Server-Timing"] = server_timing(state, total)
+    return response
+
+
+def _stat_lines():
+    counters = ["# TYPE component_stats untyped"]
+    ratios = ["# TYPE cache_hit_ratio gauge"]
+    for source, get_stats in sorted(_stats.items()):
+        stats = get_stats() or {}
+        for name, value in sorted(stats.items()):
+            counters.append(
+                f'component_stats{{source="{source}",stat="{name}"}} {value}'
+            )
+        if "hits" in stats and "misses" in stats:
+            hits = stats["hits"] + stats.get("negative_hits", 0)
+            lookups = hits + stats["misses"]
+            ratio = hits / lookups if lookups else 0.0
+            ratios.append(f'cache_hit_ratio{{cache="{source}"}} {ratio:.4f}')
+    return counters + ratios
+
+
+def exposition():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.expose())
+    lines.extend(_stat_lines())
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request):
+    if METRICS_TOKEN and request.headers.get("authorization") != (
+        f"Bearer {METRICS_TOKEN}"
+    ):
+        return Response("Unauthorized", status_code=401)
+    return PlainTextResponse(exposition(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,58 @@
+import asyncio
+import base64
+import binascii
+import os
+
+CARD_PAGE_SIZE = int(os.getenv("CARD_PAGE_SIZE", "20"))
+CARD_PAGE_MAX = int(os.getenv("CARD_PAGE_MAX", "100"))
+# exact, planned or estimated, see PostgREST's Prefer: count=...
+CARD_COUNT_METHOD = os.getenv("CARD_COUNT_METHOD", "exact")
+
+
+def encode_cursor(id):
+    return base64.urlsafe_b64encode(f"id:{id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        prefix, _, id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().partition(":")
+        )
+        if prefix == "id":
+            return int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        pass
+    raise ValueError("Invalid cursor")
+
+
+async def keyset_page(db, table, user_id, columns, first, after, with_count):
+    # returns up to first rows with id > after, whether more follow, and the
+    # user's total when asked for
+    if first is None:
+        first = CARD_PAGE_SIZE
+    if not 0 <= first <= CARD_PAGE_MAX:
+        raise ValueError(f"first must be between 0 and {CARD_PAGE_MAX}")
+    after_id = decode_cursor(after) if after is not None else None
+    count = CARD_COUNT_METHOD if with_count else None
+
+    # the count rides along with the first page, later pages count separately
+    page = db.table(table).select(columns, count=count if after_id is None else None)
+    page = page.eq("user_id", user_id)
+    if after_id is not None:
+        page = page.gt("id", after_id)
+    page = page.order("id").limit(first + 1).execute()
+    if with_count and after_id is not None:
+        counted = (
+            db.table(table)
+            .select("id", count=count)
+            .eq("user_id", user_id)
+            .limit(0)
+            .execute()
+        )
+        result, counted = await asyncio.gather(page, counted)
+        total = counted.count
+    else:
+        result = await page
+        total = result.count
+    rows = result.data[:first]
+    return rows, len(result.data) > first, total
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+from graphql import GraphQLError, parse, specified_rules, validate
+from strawberry.extensions import SchemaExtension
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http import GraphQLRequestData
+from strawberry.http.exceptions import HTTPException
+from strawberry.types import ExecutionResult
+from utils.lru import LRUCache
+
+# parsed and validated documents, keyed by schema and query text
+QUERY_DOCUMENT_CACHE_SIZE = int(os.getenv("QUERY_DOCUMENT_CACHE_SIZE", "256"))
+# hashes learnt from clients through automatic persisted queries
+PERSISTED_QUERY_CACHE_SIZE = int(os.getenv("PERSISTED_QUERY_CACHE_SIZE", "1000"))
+# JSON object of sha256 hash -> query text, registered at startup
+PERSISTED_QUERIES_FILE = os.getenv("PERSISTED_QUERIES_FILE")
+# reject any query that is not in PERSISTED_QUERIES_FILE
+PERSISTED_QUERIES_ONLY = os.getenv("PERSISTED_QUERIES_ONLY", "false").lower() == "true"
+
+documents = LRUCache(max_entries=QUERY_DOCUMENT_CACHE_SIZE)
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class DocumentCache(SchemaExtension):
+    # skips parsing and validation for query text this schema has seen before
+    def on_parse(self):
+        execution_context = self.execution_context
+        self.key = (id(execution_context.schema), execution_context.query)
+        self.cached = documents.get(self.key)
+        if self.cached is not None:
+            execution_context.graphql_document = self.cached[0]
+        yield
+
+    def on_validate(self):
+        execution_context = self.execution_context
+        if self.cached is not None:
+            execution_context.errors = self.cached[1]
+        yield
+        if self.cached is None:
+            documents.set(
+                self.key,
+                (execution_context.graphql_document, execution_context.errors),
+            )
+
+
+def prepare_documents(schema, queries):
+    # parses and validates queries ahead of their first request, skipping the
+    # ones written for another schema
+    prepared = 0
+    for query in queries:
+        try:
+            document = parse(query)
+        except GraphQLError:
+            continue
+        if not validate(schema._schema, document, specified_rules):
+            documents.set((id(schema), query), (document, []))
+            prepared += 1
+    return prepared
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+    def as_graphql_error(self):
+        return GraphQLError(str(self), extensions={"code": self.code})
+
+
+class PersistedQueries:
+    def __init__(
+        self,
+        registered=None,
+        max_entries=PERSISTED_QUERY_CACHE_SIZE,
+        only_registered=PERSISTED_QUERIES_ONLY,
+    ):
+        self.registered = {}
+        for sha256_hash, query in (registered or {}).items():
+            if query_hash(query) != sha256_hash:
+                raise ValueError(
+                    f"Persisted query {sha256_hash} does not match its hash"
+                )
+            self.registered[sha256_hash] = query
+        self.learnt = LRUCache(max_entries=max_entries)
+        self.only_registered = only_registered
+
+    @classmethod
+    def from_file(cls, path=PERSISTED_QUERIES_FILE, **kwargs):
+        registered = None
+        if path:
+            with open(path) as f:
+                registered = json.load(f)
+        return cls(registered, **kwargs)
+
+    def lookup(self, sha256_hash):
+        query = self.registered.get(sha256_hash)
+        if query is None and not self.only_registered:
+            query = self.learnt.get(sha256_hash)
+        return query
+
+    def resolve(self, query, extensions):
+        # returns the query text to run for a request's query and extensions
+        persisted = (extensions or {}).get("persistedQuery")
+        sha256_hash = persisted.get("sha256Hash") if persisted else None
+        if query is None:
+            if sha256_hash is None:
+                return None
+            query = self.lookup(sha256_hash)
+            if query is None:
+                raise PersistedQueryError(
+                    "PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND"
+                )
+            return query
+
+        if sha256_hash is not None or self.only_registered:
+            actual_hash = query_hash(query)
+            if sha256_hash is not None and sha256_hash != actual_hash:
+                raise HTTPException(400, "provided sha256Hash does not match query")
+            if self.only_registered and actual_hash not in self.registered:
+                raise PersistedQueryError(
+                    "PersistedQueryNotInList", "PERSISTED_QUERY_NOT_IN_LIST"
+                )
+            if sha256_hash is not None and actual_hash not in self.registered:
+                self.learnt.set(actual_hash, query)
+        return query
+
+
+persisted_queries = PersistedQueries.from_file()
+
+
+class PersistedQueryRouter(GraphQLRouter):
+    # GraphQLRouter that also accepts Apollo style automatic persisted queries,
+    # on GET as well so public queries can be cached by URL
+    def __init__(self, *args, persisted_queries=persisted_queries, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.persisted_queries = persisted_queries
+
+    async def parse_http_body(self, request):
+        content_type = request.content_type or ""
+        if "application/json" in content_type:
+            data = self.parse_json(await request.get_body())
+        elif request.method == "GET" and not content_type.startswith(
+            "multipart/form-data"
+        ):
+            data = self.parse_query_params(request.query_params)
+        else:
+            request_data = await super().parse_http_body(request)
+            request_data.query = self.persisted_queries.resolve(
+                request_data.query, None
+            )
+            return request_data
+
+        if not isinstance(data, dict):
+            raise HTTPException(400, "Expected a JSON object")
+        extensions = data.get("extensions")
+        if isinstance(extensions, str):
+            extensions = self.parse_json(extensions)
+        return GraphQLRequestData(
+            query=self.persisted_queries.resolve(data.get("query"), extensions),
+            variables=data.get("variables"),
+            operation_name=data.get("operationName"),
+        )
+
+    async def execute_operation(self, request, context, root_value):
+        try:
+            return await super().execute_operation(request, context, root_value)
+        except PersistedQueryError as e:
+            return ExecutionResult(data=None, errors=[e.as_graphql_error()])
+
+    def should_render_graphiql(self, request):
+        # a GET with only a persisted query hash is an operation, not GraphiQL
+        return (
+            super().should_render_graphiql(request)
+            and request.query_params.get("extensions") is None
+        )
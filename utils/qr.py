@@ -0,0 +1,99 @@
+import functools
+import os
+import numpy as np
+import qrcode
+from PIL import Image, ImageColor
+from utils.encoding import encode_image
+from utils.lru import LRUCache
+
+QR_CACHE_MAX_BYTES = int(os.getenv("QR_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+QR_CACHE_MAX_ENTRIES = int(os.getenv("QR_CACHE_MAX_ENTRIES", "1024"))
+
+# (data, box_size, border, fill_color, back_color, image_size) -> [image, png bytes]
+qr_codes = LRUCache(max_entries=QR_CACHE_MAX_ENTRIES, max_bytes=QR_CACHE_MAX_BYTES)
+
+
+@functools.lru_cache(maxsize=256)
+def _module_index(modules, box_size, size):
+    # ask Pillow which source pixel a nearest-neighbour resize samples for each
+    # target pixel, so the direct raster matches make_image().resize() exactly
+    ramp = np.arange(modules * box_size, dtype=np.int32)[np.newaxis, :]
+    sampled = Image.fromarray(ramp, "I").resize((size, 1), Image.NEAREST)
+    return np.asarray(sampled)[0] // box_size
+
+
+def _render_qr_code(website, box_size, border, fill_color, back_color, image_size):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(website)
+    qr.make(fit=True)
+
+    matrix = np.array(qr.get_matrix(), dtype=bool)
+
+    if fill_color == "black" and back_color == "white":
+        # 1-bit codes were resized nearest-neighbour, so sample the module
+        # matrix straight at the target size
+        width, height = image_size
+        rows = _module_index(matrix.shape[0], box_size, height)
+        cols = _module_index(matrix.shape[0], box_size, width)
+        return Image.fromarray(~matrix[rows[:, np.newaxis], cols])
+
+    # coloured codes come back from qrcode as RGB, which resize() smooths with
+    # bicubic, so upscale the modules by box_size and resample each band
+    fills = ImageColor.getrgb(fill_color)
+    backs = ImageColor.getrgb(back_color)
+    size = matrix.shape[0] * box_size
+    bands = {}
+    for fill, back in set(zip(fills, backs)):
+        modules = np.where(matrix, fill, back).astype(np.uint8)
+        band = Image.fromarray(modules, "L").resize((size, size), Image.NEAREST)
+        bands[(fill, back)] = band.resize(image_size, Image.BICUBIC)
+    return Image.merge("RGB", [bands[pair] for pair in zip(fills, backs)])
+
+
+def _entry_size(image, png):
+    width, height = image.size
+    return width * height * len(image.getbands()) + len(png or b"")
+
+
+def _cached_qr_code(key):
+    entry = qr_codes.get(key)
+    if entry is None:
+        image = _render_qr_code(*key)
+        entry = [image, None]
+        qr_codes.set(key, entry, _entry_size(image, None))
+    return entry
+
+
+# the returned image is shared between callers, paste it rather than drawing on it
+def generate_qr_code(
+    website,
+    box_size=10,
+    border=2,
+    fill_color="black",
+    back_color="#CCCCCC",
+    image_size=(300, 300),
+):
+    key = (website, box_size, border, fill_color, back_color, tuple(image_size))
+    return _cached_qr_code(key)[0]
+
+
+def generate_qr_png(
+    website,
+    box_size=10,
+    border=2,
+    fill_color="black",
+    back_color="#CCCCCC",
+    image_size=(300, 300),
+):
+    key = (website, box_size, border, fill_color, back_color, tuple(image_size))
+    entry = _cached_qr_code(key)
+    if entry[1] is None:
+        entry[1] = encode_image(entry[0], "png")
+        # account for the encoded bytes now that they are held too
+        qr_codes.set(key, entry, _entry_size(entry[0], entry[1]))
+    return entry[1]
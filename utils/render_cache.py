@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+from utils.encoding import VARIANTS
+from utils.lru import LRUCache
+
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# optional second tier that survives restarts, only used when a directory is set
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR")
+RENDER_CACHE_DIR_MAX_BYTES = int(
+    os.getenv("RENDER_CACHE_DIR_MAX_BYTES", str(512 * 1024 * 1024))
+)
+# copying an earlier upload server-side is only safe while no other instance can
+# overwrite that object, so it stays off unless a single process owns the writes
+RENDER_CACHE_STORAGE_COPY = (
+    os.getenv("RENDER_CACHE_STORAGE_COPY", "false").lower() == "true"
+)
+RENDER_CACHE_LOCATIONS = int(os.getenv("RENDER_CACHE_LOCATIONS", "10000"))
+
+
+def render_key(base_card, template_version, layout_version, values, encoding=None):
+    payload = json.dumps(
+        [base_card, template_version, layout_version, values, encoding],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size_bytes = sum(size for _, _, size in self._entries())
+
+    def _path(self, key, variant):
+        return os.path.join(self.directory, f"{key}.{variant}")
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def get(self, key, variants):
+        data = {}
+        try:
+            for variant in variants:
+                path = self._path(key, variant)
+                with open(path, "rb") as f:
+                    data[variant] = f.read()
+                # the mtime doubles as the last use for eviction
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key, data):
+        with self._lock:
+            for variant, content in data.items():
+                path = self._path(key, variant)
+                if os.path.exists(path):
+                    continue
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+                self.size_bytes += len(content)
+            if self.size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self.size_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.size_bytes -= size
+
+
+class RenderCache:
+    def __init__(
+        self,
+        max_bytes=RENDER_CACHE_MAX_BYTES,
+        directory=RENDER_CACHE_DIR,
+        disk_max_bytes=RENDER_CACHE_DIR_MAX_BYTES,
+        storage_copy=RENDER_CACHE_STORAGE_COPY,
+        max_locations=RENDER_CACHE_LOCATIONS,
+    ):
+        self.memory = LRUCache(max_bytes=max_bytes)
+        self.disk = DiskCache(directory, disk_max_bytes) if directory else None
+        self.storage_copy = storage_copy
+        # render key -> storage objects holding each variant, and object -> key
+        self.locations = LRUCache(max_entries=max_locations)
+        self._objects = LRUCache(max_entries=max_locations)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "copies": 0}
+
+    def get(self, key, variants=VARIANTS):
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            data = self.disk.get(key, variants)
+            if data is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.set(key, data, sum(map(len, data.values())))
+        self.stats["hits" if data is not None else "misses"] += 1
+        return data
+
+    def set(self, key, data):
+        # data maps each variant to its encoded bytes
+        self.memory.set(key, data, sum(map(len, data.values())))
+        if self.disk is not None:
+            self.disk.set(key, data)
+
+    def location(self, key):
+        if not self.storage_copy:
+            return None
+        return self.locations.get(key)
+
+    def remember(self, key, paths):
+        if self.storage_copy:
+            for path in paths.values():
+                self.forget(path)
+            self.locations.set(key, paths)
+            for path in paths.values():
+                self._objects.set(path, key)
+
+    def forget(self, object_path):
+        # call whenever an object is overwritten or removed
+        key = self._objects.pop(object_path)
+        paths = self.locations.get(key) if key is not None else None
+        if paths is not None and object_path in paths.values():
+            self.locations.pop(key)
+
+    def clear(self):
+        self.memory.clear()
+        self.locations.clear()
+        self._objects.clear()
+
+
+render_cache = RenderCache()
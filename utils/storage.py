@@ -0,0 +1,115 @@
+import asyncio
+import os
+import random
+
+# storage requests in flight at once across all requests of this process
+STORAGE_CONCURRENCY = int(os.getenv("STORAGE_CONCURRENCY", "16"))
+STORAGE_ATTEMPTS = int(os.getenv("STORAGE_ATTEMPTS", "3"))
+# seconds before the first retry, doubled (with jitter) for every further one
+STORAGE_BACKOFF = float(os.getenv("STORAGE_BACKOFF", "0.1"))
+# how often objects that could not be removed yet are tried again
+STORAGE_CLEANUP_INTERVAL = float(os.getenv("STORAGE_CLEANUP_INTERVAL", "30"))
+
+_semaphore = None
+
+
+def _limit():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(STORAGE_CONCURRENCY)
+    return _semaphore
+
+
+def is_transient(error):
+    import httpx
+    from storage3.utils import StorageException
+
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, StorageException) and error.args:
+        details = error.args[0]
+        status = details.get("statusCode") if isinstance(details, dict) else None
+        return status is not None and (int(status) >= 500 or int(status) == 429)
+    return False
+
+
+async def with_retries(call, *args, attempts=STORAGE_ATTEMPTS):
+    # runs a storage call under the shared limit, retrying failures that may pass
+    for attempt in range(1, attempts + 1):
+        try:
+            async with _limit():
+                return await call(*args)
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+        delay = STORAGE_BACKOFF * 2 ** (attempt - 1)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+
+async def upload(bucket, path, content, file_options):
+    return await with_retries(bucket.upload, path, content, file_options)
+
+
+async def copy(bucket, source, destination):
+    return await with_retries(bucket.copy, source, destination)
+
+
+async def remove(bucket, paths):
+    if paths:
+        return await with_retries(bucket.remove, list(paths))
+
+
+class OrphanCleaner:
+    # removes objects nothing points at any more off the request path, keeping
+    # the ones that failed for the next sweep; get_storage returns the storage
+    # client, so the cleaner does not have to create one before it is needed
+    def __init__(self, get_storage, interval=STORAGE_CLEANUP_INTERVAL):
+        self.get_storage = get_storage
+        self.interval = interval
+        self.pending = {}
+        self.stats = {"removed": 0, "failed": 0}
+        self._tasks = set()
+        self._sweeper = None
+
+    def start(self):
+        # the periodic sweep retrying removals that failed
+        self._sweeper = asyncio.ensure_future(self._sweep_forever())
+
+    def remove_later(self, bucket_name, paths):
+        paths = [path for path in paths if path]
+        if not paths:
+            return
+        task = asyncio.ensure_future(self._remove(bucket_name, paths))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _remove(self, bucket_name, paths):
+        try:
+            await remove(self.get_storage().from_(bucket_name), paths)
+        except Exception:
+            self.stats["failed"] += 1
+            self.pending.setdefault(bucket_name, set()).update(paths)
+        else:
+            self.stats["removed"] += len(paths)
+
+    async def sweep(self):
+        pending, self.pending = self.pending, {}
+        await asyncio.gather(
+            *(
+                self._remove(bucket_name, paths)
+                for bucket_name, paths in pending.items()
+            )
+        )
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sweep()
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        # let removals already started finish, then try the leftovers once more
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.sweep()
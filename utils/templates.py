@@ -0,0 +1,80 @@
+import asyncio
+import io
+import os
+import time
+from utils.lru import LRUCache
+
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "8"))
+# how long a bucket listing is served before it is refreshed in the background
+TEMPLATE_REVALIDATE_SECONDS = float(os.getenv("TEMPLATE_REVALIDATE_SECONDS", "300"))
+
+templates = LRUCache(max_entries=TEMPLATE_CACHE_SIZE)
+_listing = {"checked_at": None, "versions": {}, "names": (), "refreshing": None}
+
+
+def _file_version(file):
+    metadata = file.get("metadata") or {}
+    return (metadata.get("eTag"), metadata.get("size"))
+
+
+async def _refresh_listing(bucket):
+    files = await bucket.list()
+    _listing["versions"] = {file["name"]: _file_version(file) for file in files}
+    _listing["names"] = tuple(file["name"] for file in files)
+    _listing["checked_at"] = time.monotonic()
+
+
+async def _background_refresh(bucket):
+    try:
+        await _refresh_listing(bucket)
+    except Exception:
+        # keep serving what we have, the next request will try again
+        pass
+    finally:
+        _listing["refreshing"] = None
+
+
+async def _current_listing(bucket):
+    checked_at = _listing["checked_at"]
+    if checked_at is None:
+        await _refresh_listing(bucket)
+    elif (
+        time.monotonic() - checked_at > TEMPLATE_REVALIDATE_SECONDS
+        and _listing["refreshing"] is None
+    ):
+        # stale while revalidate, this request gets the listing we already have
+        _listing["refreshing"] = asyncio.ensure_future(_background_refresh(bucket))
+    return _listing
+
+
+async def _current_versions(bucket):
+    return (await _current_listing(bucket))["versions"]
+
+
+async def template_names(bucket):
+    return (await _current_listing(bucket))["names"]
+
+
+async def template_version(bucket, base_card):
+    return (await _current_versions(bucket)).get(base_card)
+
+
+async def get_template(bucket, base_card):
+    from PIL import Image
+
+    version = (await _current_versions(bucket)).get(base_card)
+    cached = templates.get(base_card)
+    if cached is not None and cached[0] == version:
+        return cached[1].copy()
+
+    base_image = Image.open(io.BytesIO(await bucket.download(base_card)))
+    base_image.load()
+    templates.set(base_card, (version, base_image))
+    return base_image.copy()
+
+
+async def warm_templates(bucket, base_cards):
+    versions = await _current_versions(bucket)
+    for base_card in base_cards:
+        if base_card in versions:
+            await get_template(bucket, base_card)